@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+audio.py: Built-in sample-playback piano using the per-key recordings in
+samplesS/ (one 16-bit stereo WAV per MIDI note 21-108).
+Renders a MidiModel schedule with velocity and sustain pedal, block by block:
+- offline, into a WAV file (much faster than real time)
+- in real time, through SynthOutput, a drop-in for pygame.midi.Output used
+  when no MIDI device is available.
+
+    python audio.py imports/song.mid -o song.wav
+"""
+import os
+import sys
+import time
+import wave
+import struct
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from notetable import EV_ON, EV_OFF, EV_PEDAL
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samplesS')
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 512
+
+
+def wav_layout(path):
+    """(format tag, channels, sample rate, bits per sample, data offset, data bytes) of a RIFF/WAVE file."""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f'{path}: not a RIFF/WAVE file')
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f'{path}: no data chunk')
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', f.read(16))
+                fmt = (tag, channels, rate, bits)
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'{path}: data chunk before fmt chunk')
+                return fmt + (f.tell(), size)
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+class SampleBank:
+    """Key samples, touched only when a note actually needs them.
+
+    16-bit PCM recordings at the bank's rate are memory-mapped read-only and
+    mixed straight from the int16 pages, so every process (GUI, export
+    workers) shares the OS page cache instead of holding a private copy.
+    Recordings that need converting (other rate, mono) are decoded to
+    float32 into a least-recently-used cache bounded by `max_bytes`.
+    """
+
+    def __init__(self, directory=SAMPLES_DIR, sample_rate=SAMPLE_RATE, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.mapped = {}                 # note -> int16 memmap (frames, 2), or None if missing
+        self.decoded = OrderedDict()     # note -> float32 (frames, 2), LRU order
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0          # private decoded memory
+        self.mapped_bytes = 0            # shared, file-backed
+
+    def path(self, note):
+        return os.path.join(self.directory, f'{note}.wav')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'resident_bytes': self.resident_bytes, 'mapped_bytes': self.mapped_bytes,
+                'decoded_keys': len(self.decoded), 'mapped_keys': sum(m is not None for m in self.mapped.values())}
+
+    def get(self, note):
+        """Sample for a MIDI note as a (frames, 2) int16 or float32 array
+        (see scale()), or None when there is no recording for it."""
+        with self.lock:
+            if note in self.decoded:
+                self.hits += 1
+                self.decoded.move_to_end(note)
+                return self.decoded[note]
+            if note in self.mapped:
+                self.hits += 1
+                return self.mapped[note]
+            self.misses += 1
+            if not os.path.exists(self.path(note)):
+                self.mapped[note] = None
+                return None
+            data = self._open(note)
+            if data.dtype == np.int16:
+                self.mapped[note] = data
+                self.mapped_bytes += data.nbytes
+            else:
+                self.decoded[note] = data
+                self.resident_bytes += data.nbytes
+                while self.resident_bytes > self.max_bytes and len(self.decoded) > 1:
+                    _, old = self.decoded.popitem(last=False)
+                    self.resident_bytes -= old.nbytes
+                    self.evictions += 1
+            return data
+
+    @staticmethod
+    def scale(data):
+        """Factor that brings `data` to the -1..1 range."""
+        return 1.0 / 32768.0 if data.dtype == np.int16 else 1.0
+
+    def preload(self, notes):
+        """Map or decode only the given keys, e.g. the notes of one MidiModel."""
+        for note in notes:
+            self.get(note)
+
+    def _open(self, note):
+        path = self.path(note)
+        tag, channels, rate, bits, offset, size = wav_layout(path)
+        if tag not in (1, 0xFFFE) or bits != 16:
+            raise ValueError(f'{path}: expected 16-bit PCM')
+        frames = size // (2 * channels)
+        pcm = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(frames, channels))
+        if channels == 2 and rate == self.sample_rate:
+            return pcm
+        # Needs a private converted copy: mono -> stereo and/or linear resampling
+        data = pcm[:, :2] if channels >= 2 else np.repeat(pcm, 2, axis=1)
+        data = data.astype(np.float32) * np.float32(1.0 / 32768.0)
+        if rate != self.sample_rate:
+            out_frames = int(round(frames * self.sample_rate / rate))
+            src = np.arange(out_frames, dtype=np.float64) * (rate / self.sample_rate)
+            data = np.stack([np.interp(src, np.arange(frames), data[:, c]) for c in range(2)], axis=1)
+        return np.ascontiguousarray(data, dtype=np.float32)
+
+
+class Voice:
+    __slots__ = ('note', 'data', 'pos', 'gain', 'held', 'release_pos')
+
+    def __init__(self, note, data, gain):
+        self.note = note
+        self.data = data
+        self.pos = 0
+        self.gain = gain
+        self.held = True          # key is down
+        self.release_pos = None   # sample position where the damper fade starts
+
+
+class SampleSynth:
+    """Polyphonic sample player. note_on/note_off/pedal change the state,
+    mix() adds the next len(out) frames of sound into `out`."""
+
+    def __init__(self, bank, *, release=0.25, master_gain=0.5, max_voices=96):
+        self.bank = bank
+        self.release_frames = max(int(release * bank.sample_rate), 1)
+        self.master_gain = master_gain
+        self.max_voices = max_voices
+        self.voices = []
+        self.sustain = False
+        self.scratch = np.empty((0, 2), dtype=np.float32)
+
+    @staticmethod
+    def velocity_gain(velocity):
+        # DLS convention: attenuation of 40*log10(velocity/127) dB
+        return (velocity / 127.0) ** 2
+
+    def note_on(self, note, velocity):
+        data = self.bank.get(note)
+        if data is None:
+            return
+        # A re-struck key damps its previous voice
+        for v in self.voices:
+            if v.note == note and v.release_pos is None:
+                v.held = False
+                v.release_pos = v.pos
+        if len(self.voices) >= self.max_voices:
+            self.voices.pop(0)
+        gain = self.velocity_gain(velocity) * self.master_gain * self.bank.scale(data)
+        self.voices.append(Voice(note, data, np.float32(gain)))
+
+    def note_off(self, note):
+        for v in self.voices:
+            if v.note == note and v.held:
+                v.held = False
+                if not self.sustain and v.release_pos is None:
+                    v.release_pos = v.pos
+
+    def pedal(self, value):
+        self.sustain = value >= 64
+        if not self.sustain:
+            for v in self.voices:
+                if not v.held and v.release_pos is None:
+                    v.release_pos = v.pos
+
+    def all_notes_off(self):
+        self.sustain = False
+        for v in self.voices:
+            v.held = False
+            if v.release_pos is None:
+                v.release_pos = v.pos
+
+    def mix(self, out):
+        n = len(out)
+        if len(self.scratch) < n:
+            self.scratch = np.empty((n, 2), dtype=np.float32)
+        alive = []
+        for v in self.voices:
+            end = min(v.pos + n, len(v.data))
+            count = end - v.pos
+            if count > 0:
+                # Converts int16 pages to float32 on the fly, without temporaries
+                tmp = np.multiply(v.data[v.pos:end], v.gain, out=self.scratch[:count], casting='unsafe')
+                if v.release_pos is not None:
+                    # Linear fade from the release point
+                    env = (np.arange(v.pos, end, dtype=np.float32) - v.release_pos) * np.float32(-1.0 / self.release_frames)
+                    env += np.float32(1.0)
+                    np.clip(env, 0.0, 1.0, out=env)
+                    tmp *= env[:, None]
+                out[:count] += tmp
+            v.pos = end
+            finished = v.pos >= len(v.data) or (
+                v.release_pos is not None and v.pos >= v.release_pos + self.release_frames)
+            if not finished:
+                alive.append(v)
+        self.voices = alive
+        return out
+
+
+def render_schedule(schedule, bank, *, block_size=BLOCK_SIZE, tail=2.0, **synth_options):
+    """Yield float32 (block_size, 2) blocks for a SCHEDULE_DTYPE table, with
+    every event applied at its exact sample frame."""
+    synth = SampleSynth(bank, **synth_options)
+    sr = bank.sample_rate
+    bank.preload(np.unique(schedule['note'][schedule['type'] == EV_ON]).tolist())
+    frames = np.round(schedule['time'] * sr).astype(np.int64)
+    events = list(zip(frames.tolist(), schedule['type'].tolist(), schedule['note'].tolist(), schedule['value'].tolist()))
+    total = (int(frames[-1]) if len(frames) else 0) + int(tail * sr)
+    i = 0
+    for block_start in range(0, total, block_size):
+        block = np.zeros((block_size, 2), dtype=np.float32)
+        block_end = block_start + block_size
+        cursor = block_start
+        while i < len(events) and events[i][0] < block_end:
+            frame, typ, note, value = events[i]
+            if frame > cursor:
+                synth.mix(block[cursor - block_start:frame - block_start])
+                cursor = frame
+            if typ == EV_ON:
+                synth.note_on(note, value)
+            elif typ == EV_OFF:
+                synth.note_off(note)
+            elif typ == EV_PEDAL:
+                synth.pedal(value)
+            i += 1
+        synth.mix(block[cursor - block_start:])
+        yield block
+
+
+def to_pcm16(block):
+    return (np.clip(block, -1.0, 1.0) * 32767.0).astype('<i2')
+
+
+def render_to_wav(schedule, path, bank=None, **options):
+    """Offline render of a whole schedule into a 16-bit stereo WAV. Returns seconds of audio."""
+    bank = bank or SampleBank()
+    frames = 0
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(bank.sample_rate)
+        for block in render_schedule(schedule, bank, **options):
+            w.writeframes(to_pcm16(block).tobytes())
+            frames += len(block)
+    return frames / bank.sample_rate
+
+
+class SynthOutput:
+    """Real-time mode: quacks like pygame.midi.Output (note_on, note_off,
+    write_short for the sustain pedal), and callback(frames) pulls the next
+    block of 16-bit audio. start() feeds those blocks to pygame.mixer from a
+    background thread."""
+
+    def __init__(self, bank=None, block_size=1024, **synth_options):
+        self.bank = bank or SampleBank()
+        self.block_size = block_size
+        self.synth = SampleSynth(self.bank, **synth_options)
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def note_on(self, note, velocity=127, channel=0):
+        with self.lock:
+            self.synth.note_on(note, velocity)
+
+    def note_off(self, note, velocity=0, channel=0):
+        with self.lock:
+            self.synth.note_off(note)
+
+    def write_short(self, status, data1=0, data2=0):
+        kind = status & 0xF0
+        if kind == 0x90 and data2 > 0:
+            self.note_on(data1, data2)
+        elif kind in (0x80, 0x90):
+            self.note_off(data1)
+        elif kind == 0xB0 and data1 == 64:
+            with self.lock:
+                self.synth.pedal(data2)
+        elif kind == 0xB0 and data1 in (120, 123):  # all sound / all notes off
+            with self.lock:
+                self.synth.all_notes_off()
+
+    def callback(self, frames):
+        block = np.zeros((frames, 2), dtype=np.float32)
+        with self.lock:
+            self.synth.mix(block)
+        return to_pcm16(block)
+
+    def start(self):
+        """Open pygame.mixer and stream callback() blocks. Raises pygame.error
+        when there is no audio device."""
+        import pygame
+        import pygame.mixer
+        import pygame.sndarray
+        pygame.mixer.init(frequency=self.bank.sample_rate, size=-16, channels=2, buffer=self.block_size)
+        channel = pygame.mixer.Channel(0)
+        block_seconds = self.block_size / self.bank.sample_rate
+        self.running = True
+
+        def feed():
+            channel.play(pygame.sndarray.make_sound(self.callback(self.block_size)))
+            while self.running:
+                if channel.get_queue() is None:
+                    channel.queue(pygame.sndarray.make_sound(self.callback(self.block_size)))
+                time.sleep(block_seconds / 4)
+
+        self.thread = threading.Thread(target=feed, name='synth-output', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a MIDI file to WAV with the bundled piano samples.')
+    parser.add_argument('midi_file', help='Path to the MIDI file')
+    parser.add_argument('-o', '--output', required=True, help='Path for the output WAV file')
+    parser.add_argument('--tail', type=float, default=2.0, help='Seconds rendered after the last event')
+    parser.add_argument('--gain', type=float, default=0.5, help='Master gain')
+    args = parser.parse_args()
+
+    from midimodel import MidiModel
+    model = MidiModel()
+    model.load(args.midi_file)
+    bank = SampleBank()
+    t0 = time.perf_counter()
+    seconds = render_to_wav(model.schedule, args.output, bank, tail=args.tail, master_gain=args.gain)
+    elapsed = time.perf_counter() - t0
+    print(f'{seconds:.1f}s of audio in {elapsed:.2f}s ({seconds / elapsed:.0f}x real time) -> {args.output}',
+          file=sys.stderr)
+    stats = bank.stats()
+    print(f"sample bank: {stats['mapped_keys']} keys mapped ({stats['mapped_bytes'] / 2**20:.1f} MiB shared), "
+          f"{stats['decoded_keys']} decoded ({stats['resident_bytes'] / 2**20:.1f} MiB private), "
+          f"{stats['hits']} hits / {stats['misses']} misses", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+benchmarks.py: Rendering and playback micro-benchmarks.
+Run one of the sub-commands, e.g.:
+    python benchmarks.py paint
+Parser throughput lives in `midiparser.py --benchmark`; `stress` and `fuzz`
+check the parser's note pairing.
+"""
+import os
+import sys
+import glob
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+# Paint benchmarks only need a raster surface, not a real display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+def synthetic_notes(count, notes_per_second=20.0, seed=0):
+    """Random notes at a constant density, so the visible set stays the same size
+    however long the song is."""
+    from notetable import NOTE_DTYPE
+    rng = np.random.default_rng(seed)
+    notes = np.empty(count, dtype=NOTE_DTYPE)
+    notes['start'] = np.sort(rng.uniform(0.0, count / notes_per_second, count))
+    notes['end'] = notes['start'] + rng.uniform(0.05, 1.5, count)
+    notes['note'] = rng.integers(21, 109, count)
+    notes['velocity'] = rng.integers(20, 128, count)
+    notes['channel'] = 0
+    notes['track'] = 0
+    return notes
+
+
+def synthetic_schedule(notes):
+    """Playback schedule (note on/off pairs plus a pedal change every 2 s) for `notes`."""
+    from notetable import EV_OFF, EV_ON, EV_PEDAL, SCHEDULE_DTYPE
+    duration = float(notes['end'].max()) if len(notes) else 0.0
+    pedal_times = np.arange(0.0, duration, 2.0)
+    schedule = np.empty(2 * len(notes) + len(pedal_times), dtype=SCHEDULE_DTYPE)
+    schedule['time'] = np.concatenate([notes['start'], notes['end'], pedal_times])
+    schedule['type'] = np.concatenate([np.full(len(notes), EV_ON), np.full(len(notes), EV_OFF),
+                                       np.full(len(pedal_times), EV_PEDAL)])
+    schedule['note'] = np.concatenate([notes['note'], notes['note'], np.full(len(pedal_times), 64)])
+    schedule['value'] = np.concatenate([notes['velocity'], np.zeros(len(notes)),
+                                        np.arange(len(pedal_times)) % 2 * 127])
+    schedule['channel'] = np.concatenate([notes['channel'], notes['channel'], np.zeros(len(pedal_times))])
+    schedule['track'] = np.concatenate([notes['track'], notes['track'], np.zeros(len(pedal_times))])
+    return schedule[np.argsort(schedule['time'], kind='stable')]
+
+
+def _qt_app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+
+def bench_paint(args):
+    app = _qt_app()
+    from PyQt5.QtGui import QPixmap
+    from main import PianoRollCanvas
+    from renderer import NoteSprites
+
+    canvas = PianoRollCanvas()
+    canvas.resize(args.width, args.height)
+    canvas.time_window = args.window
+    target = QPixmap(args.width, args.height)
+    sprites = NoteSprites(canvas.brushes)
+    print(f'{args.width}x{args.height}, window {args.window:g}s, {args.density:g} notes/s, '
+          f'{args.frames} frames per size')
+    for count in args.counts:
+        notes = synthetic_notes(count, notes_per_second=args.density)
+        duration = float(notes['end'].max())
+        canvas.load_notes(notes, duration)
+        times = np.linspace(0.0, max(duration - args.window, 0.0), args.frames)
+        medians = {}
+        for mode in args.modes:
+            # classic: one drawRoundedRect and brush change per note; density: DensityPyramid rows
+            canvas.sprites = sprites if mode == 'sprites' else None
+            canvas.note_window_max = 0.0 if mode == 'density' else float('inf')
+            canvas.render(target)  # builds the atlas or pyramid
+            samples, visible = [], 0
+            for t in times.tolist():
+                canvas.current_time = t
+                visible += sum(len(v) for _, v in canvas.layers.visible(t, t + args.window))
+                t0 = time.perf_counter()
+                canvas.render(target)
+                samples.append(time.perf_counter() - t0)
+            app.processEvents()
+            medians[mode] = statistics.median(samples)
+            print(f'{count:>10,} notes  {mode:<8} {visible / len(times):7.1f} visible/frame  '
+                  f'median {medians[mode] * 1000:7.2f} ms  '
+                  f'max {max(samples) * 1000:7.2f} ms')
+        if 'sprites' in medians and 'classic' in medians:
+            print(f'{"":>17}sprites speedup x{medians["classic"] / medians["sprites"]:.2f}')
+
+
+def bench_export(args):
+    app = _qt_app()
+    from export import render_frames
+    from midimodel import MidiModel
+
+    paths = args.files or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imports', '*.mid')))
+    print(f'{args.width}x{args.height}, first {args.frames} frames at {args.fps} fps, encoder excluded: '
+          f'fps from the first frame on, then ms until it (worker spawn and startup)')
+    for path in paths:
+        model = MidiModel()
+        model.load(path)
+        total = min(args.frames, int(model.duration * args.fps) + 1)
+        line = f'{os.path.basename(path)[:40]:<40}'
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            first = None
+            for _ in render_frames(model, args.width, args.height, args.fps, total, workers=workers):
+                if first is None:
+                    first = time.perf_counter()
+            rendering = time.perf_counter() - first
+            fps = (total - 1) / rendering if rendering > 0 else float('inf')
+            line += f'  {workers}w {fps:7.1f} fps {(first - t0) * 1000:6.0f} ms'
+        print(line, flush=True)
+    del app
+
+
+def replay_state(schedule, idx):
+    """Keyboard state by replaying every event up to idx, as seeking used to work."""
+    from notetable import EV_OFF, EV_ON, EV_PEDAL
+    held, pedal = set(), 0
+    for _, typ, note, value, _, _ in schedule[:idx].tolist():
+        if typ == EV_ON:
+            held.add(note)
+        elif typ == EV_OFF:
+            held.discard(note)
+        elif typ == EV_PEDAL:
+            pedal = value
+    return held, pedal
+
+
+def bench_seek(args):
+    from notetable import SeekIndex
+
+    rng = np.random.default_rng(0)
+    print(f'{args.seeks} random seeks per size, snapshot interval {args.interval} events')
+    for count in args.counts:
+        schedule = synthetic_schedule(synthetic_notes(count))
+        times = np.ascontiguousarray(schedule['time'])
+        t0 = time.perf_counter()
+        index = SeekIndex(schedule, args.interval)
+        build = time.perf_counter() - t0
+        targets = rng.uniform(0.0, times[-1], args.seeks).tolist()
+        samples = []
+        for t in targets:
+            t0 = time.perf_counter()
+            index.state_at(int(np.searchsorted(times, t, side='right')))
+            samples.append(time.perf_counter() - t0)
+        line = (f'{len(schedule):>10,} events  build {build * 1000:8.1f} ms  '
+                f'seek median {statistics.median(samples) * 1e6:7.1f} us  max {max(samples) * 1e6:7.1f} us')
+        if len(schedule) <= args.replay_limit:
+            samples = []
+            for t in targets[:20]:
+                t0 = time.perf_counter()
+                replay_state(schedule, int(np.searchsorted(times, t, side='right')))
+                samples.append(time.perf_counter() - t0)
+            line += f'  (full replay median {statistics.median(samples) * 1000:7.2f} ms)'
+        print(line, flush=True)
+
+
+class NullOutput:
+    def note_on(self, note, velocity=127, channel=0):
+        pass
+
+    def note_off(self, note, velocity=0, channel=0):
+        pass
+
+    def write_short(self, status, data1=0, data2=0):
+        pass
+
+
+def _busy(stop):
+    """Pure-Python work holding the GIL, standing in for a busy GUI thread."""
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+
+
+def timer_polling(schedule, duration, interval=0.03):
+    """The old update_playback loop: every `interval`, send whatever is due.
+    Returns (scheduled, actual) perf_counter pairs like PlaybackScheduler.log."""
+    times = np.ascontiguousarray(schedule['time'])
+    log, idx, start = [], 0, time.perf_counter()
+    while idx < len(times) and times[idx] <= duration:
+        time.sleep(interval)
+        now = time.perf_counter()
+        end = int(np.searchsorted(times, now - start, side='right'))
+        for i in range(idx, end):
+            log.append((start + times[i], time.perf_counter()))
+        idx = end
+    return log
+
+
+def bench_jitter(args):
+    import threading
+    from scheduler import PlaybackScheduler, lower_switch_interval
+
+    if args.file:
+        from midimodel import MidiModel
+        model = MidiModel()
+        model.load(args.file)
+        schedule = model.schedule
+    else:
+        schedule = synthetic_schedule(synthetic_notes(int(args.seconds * args.rate / 2), args.rate / 2))
+    duration = min(args.seconds, float(schedule['time'][-1]))
+
+    stop = threading.Event()
+    loaders = [threading.Thread(target=_busy, args=(stop,), daemon=True) for _ in range(args.load)]
+    for thread in loaders:
+        thread.start()
+    try:
+        lower_switch_interval(args.switch_interval / 1000)
+        scheduler = PlaybackScheduler(NullOutput(), lookahead=args.lookahead / 1000, spin=args.spin / 1000)
+        scheduler.load(schedule, duration)
+        scheduler.log = []
+        scheduler.play()
+        while not scheduler.finished:
+            time.sleep(0.05)
+        scheduler.close()
+        results = [('scheduler thread', scheduler.log)]
+        if args.baseline:
+            results.append((f'{args.interval:g} ms timer polling', timer_polling(schedule, duration, args.interval / 1000)))
+    finally:
+        stop.set()
+
+    print(f'{len(scheduler.log)} events over {duration:.1f}s, {args.load} busy thread(s); '
+          f'lateness = actual - scheduled send time')
+    for name, log in results:
+        late = np.diff(np.array(log), axis=1)[:, 0] * 1000
+        p50, p90, p99, p999 = np.percentile(late, [50, 90, 99, 99.9])
+        print(f'{name:<24} p50 {p50:7.3f}  p90 {p90:7.3f}  p99 {p99:7.3f}  p99.9 {p999:7.3f}  '
+              f'max {late.max():7.3f}  min {late.min():7.3f} ms')
+
+
+class FakeMidiOutput:
+    """Loopback stand-in for pygame.midi.Output: records every message with
+    the time it would be delivered (ms on midi_clock()) and burns `call_cost`
+    seconds per call, like the trip into PortMidi and the driver."""
+
+    def __init__(self, latency=0, call_cost=0.0):
+        self.latency = latency
+        self.call_cost = call_cost
+        self.calls = 0
+        self.delivered = []  # (delivery ms, message), in call order
+
+    @staticmethod
+    def midi_clock():
+        return time.perf_counter() * 1000.0
+
+    def _call(self):
+        self.calls += 1
+        until = time.perf_counter() + self.call_cost
+        while time.perf_counter() < until:
+            pass
+
+    def write_short(self, status, data1=0, data2=0):
+        self._call()
+        self.delivered.append((self.midi_clock(), (status, data1, data2)))
+
+    def write(self, packets):
+        self._call()
+        assert len(packets) <= 1024, 'PortMidi takes at most 1024 events per write'
+        self.delivered.extend((stamp + self.latency, tuple(message)) for message, stamp in packets)
+
+    def in_delivery_order(self):
+        order = sorted(range(len(self.delivered)), key=lambda i: self.delivered[i][0])  # stable: ties keep call order
+        return [self.delivered[i][1] for i in order]
+
+
+def stuck_notes(messages):
+    """(channel, note) pairs left on after replaying `messages` in order."""
+    sounding = set()
+    for status, note, velocity in messages:
+        if status & 0xF0 == 0x90 and velocity:
+            sounding.add((status & 0x0F, note))
+        elif status & 0xF0 in (0x80, 0x90):
+            sounding.discard((status & 0x0F, note))
+    return sounding
+
+
+def end_flush(messages):
+    """The messages PlaybackScheduler sends on stopping after `messages`:
+    note-off for each note left on, then pedal up where it is down."""
+    sustained = set()
+    for status, controller, value in messages:
+        if status & 0xF0 == 0xB0 and controller == 64:
+            (sustained.add if value >= 64 else sustained.discard)(status & 0x0F)
+    return ([(0x80 | channel, note, 0) for channel, note in sorted(stuck_notes(messages))] +
+            [(0xB0 | channel, 64, 0) for channel in sorted(sustained)])
+
+
+def bench_midiout(args):
+    from scheduler import PlaybackScheduler, lower_switch_interval, schedule_messages
+
+    lower_switch_interval()
+    schedule = synthetic_schedule(synthetic_notes(int(args.seconds * args.rate / 2), args.rate / 2))
+    duration = min(args.seconds, float(schedule['time'][-1]))
+    expected = [tuple(m) for m in schedule_messages(schedule[schedule['time'] <= duration]).tolist()]
+    modes = [('write_short per event', {}),
+             (f'write, {args.write_ahead:g} ms batches', dict(write_ahead=args.write_ahead / 1000, latency=args.latency))]
+
+    print(f'{len(expected)} events over {duration:.1f}s, {args.call_cost:g} us per output call')
+    for name, options in modes:
+        for interrupt in (False, True):
+            output = FakeMidiOutput(options.get('latency', 0), args.call_cost / 1e6)
+            scheduler = PlaybackScheduler(output, midi_clock=output.midi_clock, **options)
+            spent = [0.0]
+            emit = scheduler._emit
+
+            def timed_emit(*a, emit=emit, spent=spent):
+                start = time.perf_counter()
+                emit(*a)
+                spent[0] += time.perf_counter() - start
+            scheduler._emit = timed_emit
+            scheduler.load(schedule, duration)
+            scheduler.play()
+            if interrupt:
+                # Pause, resume, then jump back, all mid-song
+                time.sleep(duration / 3)
+                scheduler.pause()
+                time.sleep(0.2)
+                scheduler.play()
+                time.sleep(duration / 6)
+                scheduler.seek(duration / 4)
+            while not scheduler.finished:
+                time.sleep(0.05)
+            scheduler.close()
+
+            received = output.in_delivery_order()
+            if interrupt:
+                check = f'{len(stuck_notes(received))} stuck notes'
+            else:
+                # The schedule in order, then the flush of the notes and pedals cut at the end
+                in_order = received == expected + end_flush(expected)
+                check = 'order ok' if in_order else 'ORDER WRONG'
+                check += f', {len(stuck_notes(received))} stuck notes'
+            label = name + (' + pause/seek' if interrupt else '')
+            print(f'{label:<40} {output.calls:7d} calls  {output.calls / len(received):6.3f} calls/event  '
+                  f'{spent[0] / len(received) * 1e6:7.2f} us/event  {check}')
+
+
+def _varlen(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def write_raw_midi(path, tracks, ticks_per_beat=480):
+    """Format 1 file whose tracks are lists of (delta ticks, message bytes),
+    written byte for byte (so messages may use running status), each
+    closed with an End of Track meta event."""
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big')
+                + len(tracks).to_bytes(2, 'big') + ticks_per_beat.to_bytes(2, 'big'))
+        for events in tracks:
+            body = b''.join(_varlen(delta) + message for delta, message in events) + b'\x00\xff\x2f\x00'
+            f.write(b'MTrk' + len(body).to_bytes(4, 'big') + body)
+
+
+def make_retrigger_stress_midi(path, retriggers, keys=4):
+    """One track striking `keys` keys in turn, a tick apart, `retriggers` times
+    in all, with a note-off (running-status velocity 0) for only every other
+    note-on: open notes pile up on every key until midiparser.MAX_OPEN_PER_KEY."""
+    events = [(0, b'\x90\x3c\x40')]
+    for i in range(1, retriggers):
+        key = 60 + i % keys
+        events.append((1, bytes((key, 64))))
+        if i % 2:
+            events.append((0, bytes((key, 0))))
+    write_raw_midi(path, [events])
+
+
+def bench_stress(args):
+    """iter_midi time and peak traced memory on make_retrigger_stress_midi files:
+    time should grow linearly with the event count and memory stay flat."""
+    from midiparser import iter_midi
+    retriggers, pairing = args.retriggers, args.pairing
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in retriggers:
+            path = os.path.join(tmp, f'retrigger-{n}.mid')
+            make_retrigger_stress_midi(path, n)
+            t0 = time.perf_counter()
+            notes = sum(kind == 'note' for kind, _ in iter_midi(path, pairing=pairing))
+            elapsed = time.perf_counter() - t0
+            tracemalloc.start()
+            for _ in iter_midi(path, pairing=pairing):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{os.path.basename(path):<60} {notes:>8} notes  {elapsed * 1000:9.1f} ms  '
+                  f'{n / elapsed:>12,.0f} note-ons/s  peak {peak / 2**20:6.1f} MiB '
+                  f'(file {os.path.getsize(path) / 2**20:.1f} MiB)')
+
+
+def _random_tracks(rng, max_tracks=4, max_events=400):
+    """Random channel-message tracks for fuzz(): re-struck keys, missing and
+    stray note-offs, velocity-0 note-offs and running status."""
+    tracks = []
+    for _ in range(rng.randint(1, max_tracks)):
+        p_on = rng.choice((0.45, 0.9))  # 0.9 piles notes up past MAX_OPEN_PER_KEY
+        events, running = [], None
+        for _ in range(rng.randint(0, max_events)):
+            delta = rng.choice((0, 0, 1, rng.randint(0, 500)))
+            channel = rng.choice((0, 0, 1, 9))
+            key = rng.choice((60, 60, 61, rng.randint(0, 127)))
+            r = rng.random()
+            if r < p_on:
+                status, data = 0x90 | channel, bytes((key, rng.randint(1, 127)))
+            elif r < p_on + (1 - p_on) * 0.4:
+                status, data = 0x80 | channel, bytes((key, rng.randint(0, 127)))
+            elif r < p_on + (1 - p_on) * 0.8:
+                status, data = 0x90 | channel, bytes((key, 0))
+            elif r < p_on + (1 - p_on) * 0.9:
+                status, data = 0xB0 | channel, bytes((64, rng.randint(0, 127)))
+            else:
+                status, data = 0xC0 | channel, bytes((rng.randint(0, 127),))
+            use_running = status == running and rng.random() < 0.5
+            events.append((delta, data if use_running else bytes((status,)) + data))
+            running = status
+        tracks.append(events)
+    return tracks
+
+
+def _reference_notes(tracks, ticks_per_beat, pairing):
+    """The pairing rules of iter_midi written out plainly (global sort, lists),
+    to check it against."""
+    import mido
+    from midiparser import MAX_OPEN_PER_KEY
+    from notetable import notes_from_rows
+    timeline = []
+    for track_idx, events in enumerate(tracks):
+        tick, running = 0, None
+        for delta, message in events:
+            tick += delta
+            if message[0] >= 0x80:
+                running, message = message[0], message[1:]
+            timeline.append((tick, track_idx, running, message))
+        timeline.append((tick, track_idx, None, None))
+    timeline.sort(key=lambda event: event[0])
+    open_notes, rows = {}, []
+    for tick, track_idx, status, data in timeline:
+        time_sec = mido.tick2second(tick, ticks_per_beat, 500000)
+        if status is None:
+            for (channel, note), entries in sorted(open_notes.items()):
+                rows.extend((s, time_sec, note, v, channel, t) for s, v, t in entries if t == track_idx)
+                open_notes[(channel, note)] = [e for e in entries if e[2] != track_idx]
+            continue
+        kind, channel = status & 0xF0, status & 0x0F
+        if kind == 0x90 and data[1] > 0:
+            entries = open_notes.setdefault((channel, data[0]), [])
+            if len(entries) >= MAX_OPEN_PER_KEY:
+                s, v, t = entries.pop(0)
+                rows.append((s, time_sec, data[0], v, channel, t))
+            entries.append((time_sec, data[1], track_idx))
+        elif kind in (0x80, 0x90) and open_notes.get((channel, data[0])):
+            s, v, t = open_notes[(channel, data[0])].pop(0 if pairing == 'fifo' else -1)
+            rows.append((s, time_sec, data[0], v, channel, t))
+    return notes_from_rows(rows)
+
+
+def _unpaired_notes(notes, schedule):
+    """How many notes lack their schedule note-on (at start) or note-off (at
+    end) with the same key, channel and track; each row pairs with one note."""
+    from notetable import EV_OFF, EV_ON
+    missing = 0
+    for kind, column in ((EV_ON, 'start'), (EV_OFF, 'end')):
+        rows = schedule[schedule['type'] == kind]
+        sent = Counter(zip(*(rows[name].tolist() for name in ('time', 'note', 'channel', 'track'))))
+        wanted = Counter(zip(*(notes[name].tolist() for name in (column, 'note', 'channel', 'track'))))
+        missing += sum((wanted - sent).values())
+    return missing
+
+
+def bench_fuzz(args):
+    """Parse `count` random files (see _random_tracks) with both pairings,
+    from the path and from mido.MidiFile, and check the notes against
+    _reference_notes. Exits with status 1 if any file failed."""
+    import mido
+    from midiparser import parse_midi_tables
+    from notetable import EV_ON
+    count, seed, log = args.count, args.seed, sys.stderr
+    rng = random.Random(seed)
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fuzz.mid')
+        for i in range(count):
+            tracks = _random_tracks(rng)
+            write_raw_midi(path, tracks)
+            case_failed = False
+            for pairing in ('fifo', 'lifo'):
+                problems = []
+                expected = np.sort(_reference_notes(tracks, 480, pairing))
+                for source in (path, mido.MidiFile(path)):
+                    data = parse_midi_tables(source, pairing)
+                    notes, schedule = data['notes'], data['playback_schedule']
+                    if not np.array_equal(np.sort(notes), expected):
+                        problems.append('notes differ from the reference')
+                    if np.any(notes['end'] < notes['start']):
+                        problems.append('note ends before it starts')
+                    if np.any(np.diff(schedule['time']) < 0):
+                        problems.append('schedule out of order')
+                    if len(notes) != np.count_nonzero(schedule['type'] == EV_ON):
+                        problems.append('note count differs from note-on count')
+                    if _unpaired_notes(notes, schedule):
+                        problems.append('note without its note-on/off in the schedule')
+                if problems:
+                    case_failed = True
+                    print(f'FAILED  case {i} ({pairing}, seed {seed}): {"; ".join(sorted(set(problems)))}', file=log)
+            failed += case_failed
+    print(f'{count} random files, {failed} failed', file=log)
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Piano roll benchmarks.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('paint', help='PianoRollCanvas paint cost versus total note count at a fixed window')
+    p.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    p.add_argument('--window', type=float, default=5.0)
+    p.add_argument('--frames', type=int, default=200)
+    p.add_argument('--width', type=int, default=1920)
+    p.add_argument('--height', type=int, default=1080)
+    p.add_argument('--density', type=float, default=20.0, help='Notes per second of song')
+    p.add_argument('--modes', nargs='+', choices=['sprites', 'classic', 'density'], default=['sprites', 'classic'])
+    p.set_defaults(func=bench_paint)
+
+    p = sub.add_parser('export', help='Offline frame rendering throughput at 1, 2, 4 and 8 worker processes')
+    p.add_argument('files', nargs='*', help='MIDI files (default: everything in imports/)')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    p.add_argument('--frames', type=int, default=1200)
+    p.add_argument('--fps', type=int, default=60)
+    p.add_argument('--width', type=int, default=1920)
+    p.add_argument('--height', type=int, default=1080)
+    p.set_defaults(func=bench_export)
+
+    p = sub.add_parser('seek', help='Keyboard state restore latency on seek versus schedule length')
+    p.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    p.add_argument('--interval', type=int, default=256)
+    p.add_argument('--seeks', type=int, default=500)
+    p.add_argument('--replay-limit', type=int, default=1000000,
+                   help='Also time the old full replay up to this many events')
+    p.set_defaults(func=bench_seek)
+
+    p = sub.add_parser('jitter', help='Playback send-time accuracy of the scheduler thread (and the old 30 ms timer)')
+    p.add_argument('file', nargs='?', help='MIDI file (default: synthetic schedule)')
+    p.add_argument('--seconds', type=float, default=10.0, help='Song seconds to play')
+    p.add_argument('--rate', type=float, default=100.0, help='Synthetic events per second')
+    p.add_argument('--lookahead', type=float, default=0.5, help='ms')
+    p.add_argument('--spin', type=float, default=2.0, help='ms')
+    p.add_argument('--switch-interval', type=float, default=1.0, help='GIL switch interval set for the run, as the app does, ms')
+    p.add_argument('--load', type=int, default=0, help='Busy Python threads competing for the GIL')
+    p.add_argument('--baseline', action='store_true', help='Also measure the old timer polling loop')
+    p.add_argument('--interval', type=float, default=30.0, help='Baseline timer interval, ms')
+    p.set_defaults(func=bench_jitter)
+
+    p = sub.add_parser('midiout', help='Per-event MIDI output cost: write_short per event versus timestamped batches')
+    p.add_argument('--seconds', type=float, default=6.0, help='Song seconds to play')
+    p.add_argument('--rate', type=float, default=2000.0, help='Synthetic events per second')
+    p.add_argument('--call-cost', type=float, default=20.0, help='Simulated cost of one output call, us')
+    p.add_argument('--write-ahead', type=float, default=50.0, help='ms')
+    p.add_argument('--latency', type=int, default=10, help='Output latency, ms')
+    p.set_defaults(func=bench_midiout)
+
+    p = sub.add_parser('stress', help='Parser time and memory on files with up to 1M re-struck keys')
+    p.add_argument('--retriggers', type=int, nargs='+', default=[100000, 1000000])
+    p.add_argument('--pairing', choices=['fifo', 'lifo'], default='fifo')
+    p.set_defaults(func=bench_stress)
+
+    p = sub.add_parser('fuzz', help='Check note pairing on random files against a reference implementation')
+    p.add_argument('count', type=int, help='Number of random files')
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_fuzz)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
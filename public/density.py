@@ -0,0 +1,73 @@
+"""
+density.py: Note-density pyramid for zoomed-out views. Level 0 holds, per
+time bin and key, how many notes sound on average across the bin; each
+further level halves the time resolution. Drawing a time span then reads
+about as many bins as there are pixel rows, whatever the note count.
+"""
+import numpy as np
+
+LOWEST_KEY = 21
+KEYS = 88
+
+
+class DensityPyramid:
+    """levels[i]: (bins, keys) float32 with bins of steps[i] seconds, bin b
+    covering [b * step, (b + 1) * step), over the notes' own key range
+    starting at key index first_key and up to their last end. Level 0 bins
+    are `base_step` long, or longer where that would take more than
+    `max_bins` bins, or more than `bins_per_note` per note (sparse layers).
+    span() and overview() return all KEYS columns."""
+
+    def __init__(self, notes, base_step=1 / 32, max_bins=8192, bins_per_note=64):
+        keys = notes['note'].astype(np.int64) - LOWEST_KEY
+        notes = notes[(keys >= 0) & (keys < KEYS)]
+        keys = keys[(keys >= 0) & (keys < KEYS)]
+        self.first_key = int(keys.min()) if len(keys) else 0
+        width = int(keys.max()) + 1 - self.first_key if len(keys) else 0
+        keys = keys - self.first_key
+        duration = float(notes['end'].max()) if len(notes) else 0.0
+        step = max(base_step, duration / min(max_bins, max(1024, bins_per_note * len(notes))))
+        bins = int(np.ceil(duration / step)) + 1
+        s = notes['start'].astype(np.float64) / step
+        e = np.maximum(notes['end'].astype(np.float64) / step, s)
+        b0, b1 = s.astype(np.int64), e.astype(np.int64)
+
+        # Bins fully covered by a note: +1 after its first bin, -1 at its last, summed up the time axis
+        full = np.zeros((bins + 1, width), dtype=np.float32)
+        spans = b1 > b0
+        np.add.at(full, (b0[spans] + 1, keys[spans]), 1.0)
+        np.add.at(full, (b1[spans], keys[spans]), -1.0)
+        level = np.cumsum(full, axis=0)[:bins]
+        # The partly covered first and last bins
+        np.add.at(level, (b0, keys), np.where(spans, b0 + 1 - s, e - s).astype(np.float32))
+        np.add.at(level, (b1[spans], keys[spans]), (e - b1)[spans].astype(np.float32))
+
+        self.levels, self.steps = [level], [step]
+        while len(level) > 1:
+            if len(level) % 2:
+                level = np.concatenate([level, np.zeros((1, width), dtype=np.float32)])
+            level = (level[0::2] + level[1::2]) * 0.5
+            self.levels.append(level)
+            self.steps.append(self.steps[-1] * 2)
+
+    def span(self, t0, t1, rows):
+        """(values, first bin start time, step) covering [t0, t1] from the
+        finest level that needs at most 2 * rows bins for it."""
+        for level, step in zip(self.levels, self.steps):
+            if (t1 - t0) / step <= 2 * rows or level is self.levels[-1]:
+                break
+        first = max(int(np.floor(t0 / step)), 0)
+        last = min(int(np.ceil(t1 / step)), len(level))
+        return self._all_keys(level[first:max(last, first)]), first * step, step
+
+    def overview(self, columns):
+        """(values, step) for the whole song from the finest level with at most `columns` bins."""
+        for level, step in zip(self.levels, self.steps):
+            if len(level) <= columns:
+                return self._all_keys(level), step
+        return self._all_keys(self.levels[-1]), self.steps[-1]
+
+    def _all_keys(self, values):
+        out = np.zeros((len(values), KEYS), dtype=np.float32)
+        out[:, self.first_key:self.first_key + values.shape[1]] = values
+        return out
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+export.py: Headless piano roll video export.
+Renders frames at a fixed fps and resolution, independent of wall-clock time,
+and either pipes raw frames to an ffmpeg process or writes an image sequence.
+
+    python export.py imports/song.mid -o song.mp4 --fps 60 --size 1920x1080
+    python export.py imports/song.mid -o frames/ --image-sequence
+    python export.py imports/song.mid -o song.mp4 --workers 8 --audio
+
+With --workers N the timeline is split into chunks rendered by a process
+pool; each worker paints straight into a shared-memory slot and the frames
+are handed to the writer in order.
+"""
+import os
+import sys
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# No window is ever shown; the offscreen platform works without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import sip
+from PyQt5.QtGui import QGuiApplication, QImage
+
+from audio import render_to_wav
+from midimodel import MidiModel
+from renderer import DEFAULT_LEFT_COLOR, DEFAULT_RIGHT_COLOR, FrameRenderer
+from workerpool import spawn_pool
+
+
+class FfmpegWriter:
+    """Streams raw BGRA frames to an ffmpeg subprocess, optionally muxed with an audio file."""
+
+    def __init__(self, path, width, height, fps, ffmpeg='ffmpeg', preset='fast', crf=18, audio=None):
+        pix_fmt = 'bgra' if sys.byteorder == 'little' else 'argb'  # QImage.Format_RGB32 memory order
+        cmd = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+        ]
+        if audio:
+            cmd += ['-i', audio, '-c:a', 'aac', '-b:a', '192k']
+        cmd += ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p', path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, image):
+        bits = image.constBits()
+        self.proc.stdin.write(bits.asstring(image.sizeInBytes()))
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f'ffmpeg exited with status {self.proc.returncode}')
+
+
+class ImageSequenceWriter:
+    """Numbered image files; PNG compression costs far more than rendering,
+    bmp is the fastest choice when the frames are re-encoded afterwards."""
+
+    def __init__(self, directory, image_format='png'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.image_format = image_format
+        self.count = 0
+
+    def write(self, image):
+        image.save(os.path.join(self.directory, f'frame_{self.count:06d}.{self.image_format}'))
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+class NullWriter:
+    """Discards frames; used to time rendering alone."""
+
+    def write(self, image):
+        pass
+
+    def close(self):
+        pass
+
+
+def frame_count(duration, fps, tail=1.0):
+    return math.ceil((duration + tail) * fps) + 1
+
+
+def _wrap_frame(address, width, height):
+    """QImage over existing memory, no copy. Only valid while that memory is."""
+    return QImage(sip.voidptr(address), width, height, width * 4, QImage.Format_RGB32)
+
+
+# Per-process state of export workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(notes, schedule, width, height, style):
+    _worker['app'] = QGuiApplication(sys.argv[:1])
+    _worker['renderer'] = FrameRenderer(notes, schedule, width, height, **style)
+    _worker['slots'] = {}
+
+
+def _render_chunk(slot_name, first, count, fps):
+    renderer = _worker['renderer']
+    slot = _worker['slots'].get(slot_name)
+    if slot is None:
+        shm = shared_memory.SharedMemory(name=slot_name)
+        slot = _worker['slots'][slot_name] = (shm, np.ndarray((shm.size,), np.uint8, buffer=shm.buf))
+    address = slot[1].ctypes.data
+    frame_bytes = renderer.width * renderer.height * 4
+    for i in range(count):
+        renderer.render((first + i) / fps, _wrap_frame(address + i * frame_bytes, renderer.width, renderer.height))
+    return first, count
+
+
+def render_frames(model, width, height, fps, total, *, workers=1, chunk_frames=16, **style):
+    """Yield the QImage for frames 0 .. total-1 in order. Each image is only
+    valid until the next one is requested.
+    style: time_window, left_color, right_color (see FrameRenderer)."""
+    if workers <= 1:
+        renderer = FrameRenderer(model.notes, model.schedule, width, height, **style)
+        for n in range(total):
+            yield renderer.render(n / fps)
+        return
+
+    frame_bytes = width * height * 4
+    # Two slots per worker: one being rendered, one being written out
+    slots = [shared_memory.SharedMemory(create=True, size=chunk_frames * frame_bytes) for _ in range(workers * 2)]
+    views = {slot.name: np.ndarray((slot.size,), np.uint8, buffer=slot.buf) for slot in slots}
+    try:
+        with spawn_pool(workers, initializer=_init_worker,
+                        initargs=(model.notes, model.schedule, width, height, style)) as pool:
+            free = deque(slot.name for slot in slots)
+            pending = deque()
+            next_frame = 0
+            while next_frame < total or pending:
+                while free and next_frame < total:
+                    name = free.popleft()
+                    count = min(chunk_frames, total - next_frame)
+                    pending.append((name, pool.submit(_render_chunk, name, next_frame, count, fps)))
+                    next_frame += count
+                name, future = pending.popleft()
+                _, count = future.result()
+                address = views[name].ctypes.data
+                for i in range(count):
+                    yield _wrap_frame(address + i * frame_bytes, width, height)
+                free.append(name)
+    finally:
+        views.clear()
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+
+
+def export(model, writer, *, width, height, fps, time_window=5.0, tail=1.0,
+           left_color=DEFAULT_LEFT_COLOR, right_color=DEFAULT_RIGHT_COLOR, workers=1, progress=None):
+    """Render every frame t = n / fps of `model` into `writer`. Returns the frame count."""
+    total = frame_count(model.duration, fps, tail)
+    frames = render_frames(model, width, height, fps, total, workers=workers,
+                           time_window=time_window, left_color=left_color, right_color=right_color)
+    for n, image in enumerate(frames):
+        writer.write(image)
+        if progress:
+            progress(n + 1, total)
+    return total
+
+
+def parse_size(text):
+    try:
+        w, h = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected WIDTHxHEIGHT, got {text!r}')
+    return w, h
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a MIDI file into a piano roll video.')
+    parser.add_argument('midi_file', help='Path to the MIDI file')
+    parser.add_argument('-o', '--output', required=True, help='Video file, or a directory with --image-sequence')
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help='WIDTHxHEIGHT (default 1920x1080)')
+    parser.add_argument('--window', type=float, default=5.0, help='Seconds of music visible above the keyboard')
+    parser.add_argument('--tail', type=float, default=1.0, help='Seconds rendered after the last note')
+    parser.add_argument('--left-color', default=DEFAULT_LEFT_COLOR, help='Color for bass notes')
+    parser.add_argument('--right-color', default=DEFAULT_RIGHT_COLOR, help='Color for high notes')
+    parser.add_argument('--filter', action='store_true', help='Drop quiet and very short notes')
+    parser.add_argument('--min-velocity', type=int, default=20)
+    parser.add_argument('--min-duration', type=float, default=0.02, help='Seconds')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Render frames in N processes (default 1; try the number of CPU cores)')
+    parser.add_argument('--audio', action='store_true',
+                        help='Add a soundtrack rendered with the bundled piano samples '
+                             '(audio.wav next to the frames with --image-sequence)')
+    parser.add_argument('--image-sequence', action='store_true', help='Write numbered image files instead of a video')
+    parser.add_argument('--image-format', default='png', choices=['png', 'bmp', 'jpg'])
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='ffmpeg executable')
+    parser.add_argument('--preset', default='fast', help='x264 preset (ultrafast ... veryslow)')
+    args = parser.parse_args()
+
+    if not args.image_sequence and shutil.which(args.ffmpeg) is None:
+        parser.error(f'{args.ffmpeg!r} not found; install ffmpeg or use --image-sequence')
+
+    app = QGuiApplication(sys.argv[:1])
+    model = MidiModel()
+    model.load(args.midi_file, filter_notes=args.filter,
+               min_velocity=args.min_velocity, min_duration=args.min_duration)
+    width, height = args.size
+    audio_path = None
+    if args.audio:
+        if args.image_sequence:
+            os.makedirs(args.output, exist_ok=True)
+            audio_path = os.path.join(args.output, 'audio.wav')
+        else:
+            fd, audio_path = tempfile.mkstemp(suffix='.wav')
+            os.close(fd)
+        seconds = render_to_wav(model.schedule, audio_path)
+        print(f'Rendered {seconds:.1f}s of audio')
+    if args.image_sequence:
+        writer = ImageSequenceWriter(args.output, args.image_format)
+    else:
+        writer = FfmpegWriter(args.output, width, height, args.fps, ffmpeg=args.ffmpeg, preset=args.preset,
+                              audio=audio_path)
+
+    t0 = time.perf_counter()
+
+    def progress(done, total):
+        if done % args.fps == 0 or done == total:
+            elapsed = time.perf_counter() - t0
+            print(f'\r{done}/{total} frames  {done / elapsed:6.1f} fps', end='', flush=True)
+
+    try:
+        total = export(model, writer, width=width, height=height, fps=args.fps, time_window=args.window,
+                       tail=args.tail, left_color=args.left_color, right_color=args.right_color,
+                       workers=args.workers, progress=progress)
+    finally:
+        writer.close()
+        if audio_path and not args.image_sequence:
+            os.remove(audio_path)
+    elapsed = time.perf_counter() - t0
+    print(f'\n{total} frames ({total / args.fps:.1f}s of video) in {elapsed:.1f}s -> {args.output}')
+    del app
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+layers.py: Per-(track, channel) note layers. Each layer has a display
+color, a visibility toggle and its output routing (MIDI channel and
+program), plus its own NoteIndex, so the roll only searches the layers
+that are shown.
+"""
+import numpy as np
+
+from density import DensityPyramid
+from notetable import EV_PEDAL, EV_PROGRAM, SCHEDULE_DTYPE, NoteIndex, empty_notes, note_events
+
+# General MIDI instrument families, 8 programs each
+GM_FAMILIES = (
+    'Piano', 'Chromatic Percussion', 'Organ', 'Guitar', 'Bass', 'Strings', 'Ensemble', 'Brass',
+    'Reed', 'Pipe', 'Synth Lead', 'Synth Pad', 'Synth Effects', 'Ethnic', 'Percussive', 'Sound Effects',
+)
+DRUM_CHANNEL = 9
+
+
+def program_name(program):
+    return f'{GM_FAMILIES[program // 8]} {program + 1}'
+
+
+class Layer:
+    """The notes of one (track, channel) pair and how to show and play them."""
+
+    def __init__(self, track, channel, program=None):
+        self.track = track
+        self.channel = channel
+        self.file_program = program  # first program change on this channel, if any
+        self.color = None        # '#rrggbb', or None for the left/right hand colors
+        self.visible = True
+        self.out_channel = channel
+        self.program = None      # None: follow the file's program changes
+        self.set_notes(empty_notes())
+
+    def set_notes(self, notes):
+        self.index = NoteIndex(notes)
+        self._density = None  # (index it was built from, DensityPyramid)
+
+    @property
+    def density(self):
+        """DensityPyramid of the layer's notes, built on first use. Safe to
+        build from another thread: a pyramid of notes replaced meanwhile by
+        set_notes is never returned."""
+        index, built = self.index, self._density
+        if built is None or built[0] is not index:
+            built = self._density = (index, DensityPyramid(index.notes))
+        return built[1]
+
+    @property
+    def density_ready(self):
+        built = self._density
+        return built is not None and built[0] is self.index
+
+    @property
+    def key(self):
+        return self.track, self.channel
+
+    @property
+    def name(self):
+        if self.channel == DRUM_CHANNEL:
+            instrument = 'Drums'
+        elif self.file_program is not None:
+            instrument = program_name(self.file_program)
+        else:
+            instrument = 'Piano'
+        return f'Track {self.track + 1} · Ch {self.channel + 1} · {instrument}'
+
+
+class LayerSet:
+    """One Layer per (track, channel) pair found in `notes`, in that order.
+    set_notes() swaps in another selection of the same notes (the filtered
+    ones) and rebuilds the per-layer indexes; the layer settings stay."""
+
+    def __init__(self, notes, schedule=None):
+        programs = {}
+        if schedule is not None:
+            changes = schedule[schedule['type'] == EV_PROGRAM]
+            for channel, program in zip(changes['channel'].tolist()[::-1], changes['value'].tolist()[::-1]):
+                programs[channel] = program
+        keys = np.unique(np.stack([notes['track'], notes['channel']], axis=1), axis=0) if len(notes) else []
+        self.layers = [Layer(track, channel, programs.get(channel)) for track, channel in np.asarray(keys).tolist()]
+        self.set_notes(notes)
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def __len__(self):
+        return len(self.layers)
+
+    def set_notes(self, notes):
+        self.notes = notes
+        order = np.lexsort((notes['channel'], notes['track']))
+        grouped = notes.take(order)
+        bounds = np.flatnonzero((np.diff(grouped['track']) != 0) | (np.diff(grouped['channel']) != 0)) + 1
+        parts = {}
+        for part in np.split(grouped, bounds) if len(grouped) else []:
+            parts[(int(part['track'][0]), int(part['channel'][0]))] = part
+        for layer in self.layers:
+            layer.set_notes(parts.get(layer.key, notes[:0]))
+
+    def visible(self, t0, t1):
+        """(layer, notes overlapping [t0, t1]) for every shown layer, in layer order."""
+        return [(layer, layer.index.visible(t0, t1)) for layer in self.layers if layer.visible]
+
+    def route(self, schedule):
+        """`schedule` as sent to the output: note events on their layer's
+        output channel, pedal and program changes copied to every output
+        channel fed by their source channel, and layer program choices
+        replacing the file's program changes on that output channel (layers
+        sharing an output channel share its program)."""
+        identity = all(layer.out_channel == layer.channel and layer.program is None for layer in self.layers)
+        if identity or not len(schedule):
+            return schedule
+        out_of = {}      # source channel -> output channels fed by it
+        fixed = {}       # output channel -> (program, track) chosen by a layer
+        for layer in self.layers:
+            out_of.setdefault(layer.channel, set()).add(layer.out_channel)
+            if layer.program is not None:
+                fixed[layer.out_channel] = (layer.program, layer.track)
+
+        types, channels, tracks = schedule['type'], schedule['channel'], schedule['track']
+        lookup = np.tile(np.arange(16, dtype=np.uint8), (int(tracks.max()) + 1, 1))
+        for layer in self.layers:
+            if layer.track < len(lookup):
+                lookup[layer.track, layer.channel] = layer.out_channel
+        picks = [np.flatnonzero(note_events(schedule))]
+        routed = [lookup[tracks[picks[0]], channels[picks[0]]]]
+        for source in range(16):
+            shared = np.flatnonzero(((types == EV_PEDAL) | (types == EV_PROGRAM)) & (channels == source))
+            for out in sorted(out_of.get(source, {source})):
+                keep = shared if out not in fixed else shared[types[shared] == EV_PEDAL]
+                picks.append(keep)
+                routed.append(np.full(len(keep), out, dtype=np.uint8))
+        picks = np.concatenate(picks)
+        order = np.argsort(picks, kind='stable')  # original event order, so times stay sorted
+        result = schedule.take(picks[order])
+        result['channel'] = np.concatenate(routed)[order]
+
+        # Chosen programs go out at time 0, ahead of everything else
+        head = np.zeros(len(fixed), dtype=SCHEDULE_DTYPE)
+        head['type'] = EV_PROGRAM
+        head['channel'] = sorted(fixed)
+        head['value'] = [fixed[out][0] for out in sorted(fixed)]
+        head['track'] = [fixed[out][1] for out in sorted(fixed)]
+        return np.concatenate([head, result])
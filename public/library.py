@@ -0,0 +1,215 @@
+"""
+library.py: Persistent index of the songs in the imports directory. Each
+MIDI file gets its metadata (duration, note count, tempo, tracks) and a
+small piano-roll thumbnail, computed by background worker processes and
+recomputed only when the file's size or mtime and then its content hash
+change. Menus read the index instead of opening the files.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from notetable import schedule_duration
+from parsecache import ParseCache
+
+INDEX_VERSION = 1
+THUMB_WIDTH, THUMB_HEIGHT = 96, 44  # time columns x pitch rows (two keys per row)
+LOWEST_KEY = 21
+
+
+def thumbnail(notes, duration, width=THUMB_WIDTH, height=THUMB_HEIGHT):
+    """(height, width) uint8 piano roll of `notes`, highest pitch on top:
+    0 where nothing sounds, brighter where more notes overlap."""
+    cells = np.zeros((height, width + 1), dtype=np.int32)
+    if len(notes) and duration > 0:
+        scale = width / duration
+        c0 = np.clip((notes['start'] * scale).astype(np.int64), 0, width - 1)
+        c1 = np.clip((notes['end'] * scale).astype(np.int64), c0, width - 1) + 1
+        rows = height - 1 - np.clip((notes['note'].astype(np.int64) - LOWEST_KEY) * height // 88, 0, height - 1)
+        # +1 where each note starts, -1 after it ends; a running sum counts the notes per cell
+        np.add.at(cells, (rows, c0), 1)
+        np.add.at(cells, (rows, c1), -1)
+        cells = np.cumsum(cells, axis=1)
+    counts = cells[:, :width]
+    return np.where(counts > 0, np.minimum(95 + counts * 40, 255), 0).astype(np.uint8)
+
+
+def _index_file(path, directory, cache_dir):
+    """Worker: the index entry for `path`. The thumbnail is written to
+    `directory`, and the parsed tables to the parse cache, so opening the
+    song later skips the parse."""
+    from midiparser import parse_midi_tables
+    st = os.stat(path)
+    key = ParseCache.key(path)
+    data = parse_midi_tables(path)
+    if cache_dir:
+        ParseCache(cache_dir).save(key, data, prune=False)  # pruned once by SongLibrary.update
+    notes, schedule = data['notes'], data['playback_schedule']
+    duration = schedule_duration(schedule)
+    tempos = data['tempo_changes']
+    thumb = os.path.join(directory, f'{key}.thumb.npy')
+    tmp = f'{thumb}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, thumbnail(notes, duration))
+    os.replace(tmp, thumb)
+    return {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'key': key,
+        'duration': duration,
+        'notes': len(notes),
+        'tempo': round(tempos[0]['tempo'], 1) if tempos else 120.0,
+        'tracks': len(np.unique(notes['track'])),
+        'lowest': int(notes['note'].min()) if len(notes) else None,
+        'highest': int(notes['note'].max()) if len(notes) else None,
+    }
+
+
+class SongLibrary:
+    """Index of the .mid files in `imports_dir`, kept in `directory`.
+    entries maps file name -> entry dict, or None for a file not indexed yet.
+    scan() is cheap (one scandir, no reads); update() does the parsing and
+    may run on a background thread."""
+
+    def __init__(self, imports_dir, directory, cache_dir=None):
+        self.imports_dir = imports_dir
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.entries = {}
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('version') == INDEX_VERSION:
+                self.entries = stored['files']
+        except (OSError, ValueError, KeyError):
+            pass  # missing or unreadable: everything gets re-indexed
+
+    def path(self, name):
+        return os.path.join(self.imports_dir, name)
+
+    def songs(self):
+        """(name, entry or None) for every known file, by name."""
+        with self.lock:
+            return sorted(self.entries.items(), key=lambda item: item[0].lower())
+
+    def thumbnail(self, entry):
+        """The entry's (THUMB_HEIGHT, THUMB_WIDTH) uint8 thumbnail, or None."""
+        try:
+            return np.load(os.path.join(self.directory, f"{entry['key']}.thumb.npy"))
+        except (OSError, ValueError):
+            return None
+
+    def scan(self):
+        """Sync the index with the directory listing. Returns the names whose
+        size or mtime changed (or that are new), which update() processes."""
+        found = {}
+        try:
+            with os.scandir(self.imports_dir) as it:
+                for item in it:
+                    if item.name.lower().endswith('.mid') and item.is_file():
+                        st = item.stat()
+                        found[item.name] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+        with self.lock:
+            for name in set(self.entries) - set(found):
+                del self.entries[name]
+            stale = []
+            for name, (size, mtime_ns) in found.items():
+                entry = self.entries.get(name)
+                if entry is None or entry['size'] != size or entry['mtime_ns'] != mtime_ns:
+                    stale.append(name)
+                    self.entries.setdefault(name, None)
+        return sorted(stale, key=str.lower)
+
+    def update(self, names, *, workers=None, done=None, stop=None):
+        """Index `names` across a process pool, saving the index as entries
+        arrive. done(name, entry) is called for each file; files that fail to
+        parse get an entry with 'error' set and are retried once they change.
+        Setting the threading.Event `stop` cancels the rest."""
+        from concurrent.futures import as_completed
+        from concurrent.futures.process import BrokenProcessPool
+        from workerpool import spawn_pool
+        names = [name for name in names if not self._touched(name, done)]
+        if not names:
+            self.save()
+            return
+        workers = workers or max(1, min((os.cpu_count() or 2) - 1, len(names)))
+        with spawn_pool(workers) as pool:
+            futures = {pool.submit(_index_file, self.path(name), self.directory, self.cache_dir): name for name in names}
+            for n, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    entry = future.result()
+                except BrokenProcessPool:
+                    continue  # the worker died, not the file's fault: still pending
+                except Exception:
+                    st = self._stat(name)
+                    if st is None:
+                        continue  # deleted meanwhile; the next scan drops it
+                    entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'key': None, 'error': True}
+                with self.lock:
+                    if name in self.entries:
+                        self.entries[name] = entry
+                if done is not None:
+                    done(name, entry)
+                if stop is not None and stop.is_set():
+                    pool.shutdown(cancel_futures=True)
+                    break
+                if n % 50 == 0:
+                    self.save(prune=False)  # thumbnails of entries still in flight are on disk already
+        self.save()
+        if self.cache_dir:
+            ParseCache(self.cache_dir).prune()
+
+    def _touched(self, name, done):
+        """Refresh the entry in place if the file's content hash is unchanged
+        (copied over, touched); True if so."""
+        with self.lock:
+            entry = self.entries.get(name)
+        st = self._stat(name)
+        if entry is None or not entry.get('key') or st is None:
+            return False
+        if not os.path.exists(os.path.join(self.directory, f"{entry['key']}.thumb.npy")):
+            return False
+        try:
+            if ParseCache.key(self.path(name)) != entry['key']:
+                return False
+        except OSError:
+            return False
+        entry = {**entry, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        with self.lock:
+            if name in self.entries:
+                self.entries[name] = entry
+        if done is not None:
+            done(name, entry)
+        return True
+
+    def _stat(self, name):
+        try:
+            return os.stat(self.path(name))
+        except OSError:
+            return None
+
+    def save(self, prune=True):
+        """Write the index atomically, then drop the thumbnails no entry uses."""
+        with self.lock:
+            files = {name: entry for name, entry in self.entries.items() if entry is not None}
+        tmp = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'files': files}, f, separators=(',', ':'))
+            os.replace(tmp, self.index_path)
+            if not prune:
+                return
+            keys = {entry['key'] for entry in files.values()}
+            for name in os.listdir(self.directory):
+                if name.endswith('.thumb.npy') and name.split('.', 1)[0] not in keys:
+                    os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass  # a read-only disk only costs us re-indexing next time
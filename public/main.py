@@ -1,37 +1,43 @@
 import sys
 import os
+import threading
 import time
-import shutil
-import pygame.midi
+from startup import profiler as startup_profiler  # first, to time the imports below
+import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QToolButton, QMenu, QAction, QFileDialog, QColorDialog,
-    QPushButton, QSlider, QLabel, QMessageBox, QCheckBox
+    QPushButton, QSlider, QLabel, QMessageBox, QCheckBox, QActionGroup
+)
+from PyQt5.QtCore import Qt, QEvent, QTimer, QThread, QPointF, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QIcon, QPixmap
+from audio import SynthOutput
+from layers import GM_FAMILIES, LayerSet, program_name
+from library import SongLibrary
+from midimodel import MidiModel
+from parsecache import ParseCache
+from profiling import FrameProfiler
+from scheduler import PlaybackScheduler, lower_switch_interval
+from notetable import EV_ON, EV_OFF, EV_PEDAL, empty_notes
+from renderer import (
+    BACKGROUND, DEFAULT_LEFT_COLOR, DEFAULT_RIGHT_COLOR,
+    KeyboardPainter, NoteBrushes, NoteSprites, density_image, keyboard_layout, paint_density, paint_notes,
+    paint_overlay_text, paint_pedal_text, thumbnail_image,
 )
-from PyQt5.QtCore import Qt, QTimer, QRectF
-from PyQt5.QtGui import QColor, QPainter, QBrush, QPen, QLinearGradient, QIcon
-from midiparser import parse_midi
 
 IMPORTS_DIR = os.path.join(os.getcwd(), 'imports')
-os.makedirs(IMPORTS_DIR, exist_ok=True)
-
-# ────────────────────────────────────────────────────────────────────────────────
-# DATA MODEL
-# ────────────────────────────────────────────────────────────────────────────────
-class MidiModel:
-    def __init__(self):
-        self.notes = []
-        self.schedule = []
-        self.duration = 0.0
-
-    def load(self, path: str, *, filter_notes=False, min_velocity=20, min_duration=0.02):
-        data = parse_midi(path)
-        notes = data['notes']
-        if filter_notes:
-            notes = [n for n in notes if n['velocity'] >= min_velocity and (n['end'] - n['start']) >= min_duration]
-        self.notes = notes
-        self.schedule = data['playback_schedule']
-        self.duration = max((e['time'] for e in self.schedule if e['type'] in ('on', 'off')), default=0.0)
+PARSE_CACHE_DIR = os.path.join(os.getcwd(), '.parse_cache')
+LIBRARY_DIR = os.path.join(os.getcwd(), '.library')
+MENU_GROUP_OVER = 40  # songs; larger libraries get one submenu per initial
+WINDOW_STEPS = tuple(range(1, 21)) + (30, 45, 60, 90, 120, 180, 300, 600)  # roll time windows, s
+NOTE_WINDOW_MAX = 20.0  # s, see PianoRollCanvas.note_window_max
+# MIDI device output: PortMidi delivers timestamped events this much after their
+# timestamp, and the scheduler writes them up to WRITE_AHEAD seconds early
+OUTPUT_LATENCY_MS = 10
+WRITE_AHEAD = 0.05
+STARTUP_BUDGET_MS = 300  # time to first paint, checked by --startup-profile
+
+startup_profiler.mark('imports')
 
 # ────────────────────────────────────────────────────────────────────────────────
 # GUI WIDGETS
@@ -41,21 +47,49 @@ class MidiModel:
 class PianoRollCanvas(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.notes = []
+        self.layers = LayerSet(empty_notes())
         self.duration = 0.0
         self.current_time = 0.0
         self.time_window = 5.0
-        self.left_color = QColor('#0077cc')
-        self.right_color = QColor('#00bb44')
+        self.left_color = QColor(DEFAULT_LEFT_COLOR)
+        self.right_color = QColor(DEFAULT_RIGHT_COLOR)
         self.pedal_text = "Pedals OFF"  # Default to OFF at startup
         self.pedal_on = False
+        self.keys = keyboard_layout(0)
+        self.brushes = NoteBrushes(self.left_color, self.right_color)
+        self.sprites = NoteSprites(self.brushes)  # None: one drawRoundedRect per note
+        self.layer_sprites = {}  # layer color -> NoteSprites
+        self.note_window_max = NOTE_WINDOW_MAX  # longer time windows paint the note density
+        self.profiler = None  # FrameProfiler when the overlay is on
+
+    def set_colors(self, left, right):
+        self.left_color = QColor(left)
+        self.right_color = QColor(right)
+        self.brushes.set_colors(left, right)
+        self.update()
 
     def load_notes(self, notes, duration):
-        self.notes = notes
+        self.load_layers(LayerSet(notes), duration)
+
+    def load_layers(self, layers, duration):
         self.duration = duration
         self.current_time = 0.0
+        self.set_layers(layers)
+
+    def set_layers(self, layers):
+        """Swap the displayed layers.LayerSet, keeping the current time."""
+        self.layers = layers
         self.update()
 
+    def note_painter(self, layer):
+        """(NoteSprites or None, NoteBrushes) drawing `layer`'s notes."""
+        if layer.color is None:
+            return self.sprites, self.brushes
+        sprites = self.layer_sprites.get(layer.color)
+        if sprites is None:
+            sprites = self.layer_sprites[layer.color] = NoteSprites(NoteBrushes(layer.color, layer.color))
+        return (sprites if self.sprites is not None else None), sprites.brushes
+
     def set_time(self, t):
         self.current_time = t
         self.update()
@@ -66,106 +100,282 @@ class PianoRollCanvas(QWidget):
         self.update()
 
     def paintEvent(self, e):
+        t0 = time.perf_counter()
         painter = QPainter(self)
         w, h = self.width(), self.height()
-        painter.fillRect(0, 0, w, h, QColor('#2e2e2e'))
-        WHITE_KEY_WIDTH = w / 52.0
-        BLACK_KEY_WIDTH = WHITE_KEY_WIDTH * 0.6
-        pps = h / self.time_window if self.time_window > 0 else 0
-        black_semitones = {1, 3, 6, 8, 10}
-        white_positions = []
-        white_count = 0
-        for midi in range(21, 109):
-            if midi % 12 not in black_semitones:
-                x = white_count * WHITE_KEY_WIDTH
-                white_positions.append((midi, x))
-                white_count += 1
-        x_map = {m: x for m, x in white_positions}
-        for midi, x in white_positions:
-            black_midi = midi + 1
-            if black_midi % 12 in black_semitones:
-                bx = x + WHITE_KEY_WIDTH - BLACK_KEY_WIDTH / 2
-                x_map[black_midi] = bx
-        for note in self.notes:
-            start, end, num = note['start'], note['end'], note['note']
-            length = end - start
-            rel = start - self.current_time
-            if -length <= rel <= self.time_window and num in x_map:
-                x = x_map[num]
-                width = BLACK_KEY_WIDTH if num % 12 in black_semitones else WHITE_KEY_WIDTH
-                y = (self.time_window - rel) * pps - length * pps
-                rect = QRectF(x, y, width, length * pps)
-                base = self.left_color if num < 60 else self.right_color
-                if num % 12 in black_semitones:
-                    base = base.darker(130)
-                grad = QLinearGradient(rect.topLeft(), rect.topRight())
-                grad.setColorAt(0, base.darker(120))
-                grad.setColorAt(1, base.lighter(120))
-                painter.setBrush(QBrush(grad))
-                painter.setPen(QPen(QColor(0, 0, 0, 150), 1))
-                painter.drawRoundedRect(rect, 4, 4)
+        painter.fillRect(0, 0, w, h, BACKGROUND)
+        if self.keys.width != w:
+            self.keys = keyboard_layout(w)
+        count = 0
+        if self.time_window > self.note_window_max:
+            # Zoomed out: cost follows the pixel rows, not the notes in the window
+            for layer in self.layers:
+                if layer.visible and len(layer.index):
+                    _, brushes = self.note_painter(layer)
+                    paint_density(painter, layer.density, self.keys, brushes, self.current_time, self.time_window, h)
+        else:
+            for layer, visible in self.layers.visible(self.current_time, self.current_time + self.time_window):
+                sprites, brushes = self.note_painter(layer)
+                if sprites is not None:
+                    sprites.paint(painter, visible, self.keys, self.current_time, self.time_window, h)
+                else:
+                    paint_notes(painter, visible, self.keys, brushes, self.current_time, self.time_window, h)
+                count += len(visible)
 
         # Draw pedal status in top-left
-        color = QColor('red') if self.pedal_on else QColor('gray')
-        font = painter.font()
-        font.setPointSize(20)  
-        painter.setFont(font)
-        painter.setPen(QPen(color))
-        painter.drawText(10, 50, self.pedal_text)
+        paint_pedal_text(painter, self.pedal_on)
 
+        if self.profiler is not None:
+            self.profiler.paint_roll(time.perf_counter() - t0, count)
+            paint_overlay_text(painter, self.profiler.summary())
         painter.end()
 
 
+class DensityBuilder(QThread):
+    """Builds the layers' DensityPyramids (Layer.density) off the GUI thread."""
+
+    def __init__(self, layers, parent=None):
+        super().__init__(parent)
+        self.layers = layers
+
+    def run(self):
+        for layer in self.layers:
+            if self.isInterruptionRequested():
+                return
+            layer.density
+
+
+class SongOverview(QWidget):
+    """Whole-song minimap under the roll: the note density of the canvas's
+    shown layers (DensityPyramid.overview), the part of the song on screen,
+    and click or drag to seek. Missing pyramids (after a filter change, say)
+    are built by a DensityBuilder; until then the last picture of the same
+    song stays up."""
+    seek_requested = pyqtSignal(float)  # song time
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.setFixedHeight(40)
+        self.cache = None  # (what it shows, QPixmap)
+        self.builder = None
+        canvas.installEventFilter(self)  # repaint along with the canvas
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            self.update()
+        return False
+
+    def _contents(self):
+        c = self.canvas
+        return (self.width(), self.height(), c.duration, c.left_color.rgba(), c.right_color.rgba(), id(c.layers),
+                tuple((layer.visible, layer.color, id(layer.index)) for layer in c.layers))
+
+    def _density_pixmap(self):
+        w, h, c = self.width(), self.height(), self.canvas
+        pixmap = QPixmap(w, h)
+        pixmap.fill(Qt.transparent)
+        shown = [(layer, layer.density.overview(w)) for layer in c.layers if layer.visible and len(layer.index)]
+        used = np.flatnonzero(np.any([values.any(axis=0) for _, (values, _) in shown], axis=0)) if shown else []
+        if not len(used):
+            return pixmap
+        # The song's key range, highest on top, max-pooled down to the pixel rows so no note line gets lost
+        keys = np.arange(used[-1], used[0] - 1, -1)
+        starts = np.linspace(0, len(keys), min(len(keys), h) + 1).astype(np.int64)[:-1]
+        painter = QPainter(pixmap)
+        for layer, (values, step) in shown:
+            _, brushes = c.note_painter(layer)
+            rows = np.maximum.reduceat(values[:, keys].T, starts, axis=0)
+            image = density_image(rows, brushes.key_colors()[keys[starts], None, :])
+            painter.drawImage(QRectF(0, 0, len(values) * step / c.duration * w, h), image)
+        painter.end()
+        return pixmap
+
+    def paintEvent(self, e):
+        painter = QPainter(self)
+        w, h, c = self.width(), self.height(), self.canvas
+        painter.fillRect(0, 0, w, h, BACKGROUND.darker(130))
+        if c.duration > 0:
+            contents = self._contents()
+            if self.cache is None or self.cache[0] != contents:
+                pending = [layer for layer in c.layers if layer.visible and len(layer.index) and not layer.density_ready]
+                if not pending:
+                    self.cache = (contents, self._density_pixmap())
+                elif self.builder is None:
+                    self.builder = DensityBuilder(pending, self)
+                    self.builder.finished.connect(self._built)
+                    self.builder.start()
+            if self.cache is not None and self.cache[0][5] == contents[5]:  # same song
+                painter.drawPixmap(self.rect(), self.cache[1])
+            x0 = c.current_time / c.duration * w
+            x1 = min(c.current_time + c.time_window, c.duration) / c.duration * w
+            painter.fillRect(QRectF(x0, 0, max(x1 - x0, 2.0), h), QColor(255, 255, 255, 40))
+            painter.setPen(QColor('#ffffff'))
+            painter.drawLine(QPointF(x0, 0), QPointF(x0, h))
+        painter.end()
+
+    def _built(self):
+        self.builder.deleteLater()
+        self.builder = None
+        self.update()  # builds again if the layers changed meanwhile
+
+    def mousePressEvent(self, e):
+        self._seek(e.x())
+
+    def mouseMoveEvent(self, e):
+        if e.buttons() & Qt.LeftButton:
+            self._seek(e.x())
+
+    def _seek(self, x):
+        if self.canvas.duration > 0 and self.width() > 0:
+            self.seek_requested.emit(min(max(x / self.width(), 0.0), 1.0) * self.canvas.duration)
+
+
 class PianoKeyboardWidget(QWidget):
+    """Thin widget around renderer.KeyboardPainter: tracks pressed keys and
+    repaints only the rectangles of keys that changed."""
+
     def __init__(self, left_color, right_color, parent=None):
         super().__init__(parent)
         self.setMinimumHeight(120)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)  # the idle pixmap covers the whole widget
         self.notes = list(range(21, 109))
         self.pressed = set()
+        self.dirty = set()  # keys changed since the last flush()
         self.left_color = QColor(left_color)
         self.right_color = QColor(right_color)
+        self.key_painter = KeyboardPainter(self.left_color, self.right_color)
+        self.profiler = None
 
-    def setPressed(self, note, on):
+    def set_colors(self, left, right):
+        self.left_color = QColor(left)
+        self.right_color = QColor(right)
+        self.key_painter.set_colors(left, right)
+        self.update()
+
+    def _update_geometry(self):
+        self.key_painter.resize(self.width(), self.height(), self.devicePixelRatioF(),
+                                self.palette().color(self.backgroundRole()))
+
+    def setPressed(self, note, on, flush=True):
         if on:
             self.pressed.add(note)
         else:
             self.pressed.discard(note)
-        self.update()
+        self.dirty.add(note)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Schedule one repaint covering every key changed since the last flush."""
+        if not self.dirty:
+            return
+        self._update_geometry()
+        region = self.key_painter.dirty_region(self.dirty)
+        self.dirty.clear()
+        self.update(region)
 
-    def paintEvent(self, _):
+    def paintEvent(self, e):
+        t0 = time.perf_counter()
+        self._update_geometry()
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        w, h = self.width(), self.height()
-        WHITE = w / 52.0
-        BLACK = WHITE * 0.6
-        BLACK_H = h * 0.6
-        black_set = {1, 3, 6, 8, 10}
-        wc = 0
-        white_pos = []
-        for m in self.notes:
-            if m % 12 not in black_set:
-                x = wc * WHITE
-                rect = QRectF(x, 0, WHITE, h)
-                painter.fillRect(rect, QColor('#ffffff'))
-                painter.setPen(QPen(QColor('#000')))
-                painter.drawRect(rect)
-                if m in self.pressed:
-                    col = self.left_color if m < 60 else self.right_color
-                    painter.fillRect(rect, col.lighter(150))
-                white_pos.append((m, x))
-                wc += 1
-        for m, x in white_pos:
-            b = m + 1
-            if b % 12 in black_set:
-                bx = x + WHITE - BLACK / 2
-                rect = QRectF(bx, 0, BLACK, BLACK_H)
-                painter.fillRect(rect, QColor('#000'))
-                painter.setPen(QPen(QColor('#000')))
-                painter.drawRect(rect)
-                if b in self.pressed:
-                    col = self.left_color if b < 60 else self.right_color
-                    painter.fillRect(rect, col.lighter(150))
+        self.key_painter.paint(painter, e.rect(), self.pressed, e.region())
         painter.end()
+        if self.profiler is not None:
+            self.profiler.paint_keyboard(time.perf_counter() - t0)
+
+# ────────────────────────────────────────────────────────────────────────────────
+# BACKGROUND LOADING
+# ────────────────────────────────────────────────────────────────────────────────
+class MidiLoader(QThread):
+    """Runs MidiModel.stream off the GUI thread. Emits `progress` with the
+    fraction read and, whenever the tables were refreshed, the notes so far;
+    `loaded` with the complete model; `failed` with the error message.
+    requestInterruption() stops it at the next progress step, silently."""
+    progress = pyqtSignal(float, object, float)  # fraction, partial LayerSet or None, duration
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, cache, filter_settings, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.cache = cache
+        self.filter_settings = filter_settings
+
+    def run(self):
+        model = MidiModel()
+        enabled, min_vel, min_dur = self.filter_settings
+        shown = None
+        try:
+            for fraction in model.stream(self.path, filter_notes=enabled, min_velocity=min_vel,
+                                         min_duration=min_dur, cache=self.cache):
+                if self.isInterruptionRequested():
+                    return
+                if fraction < 1.0:
+                    fresh = model.layers is not shown
+                    shown = model.layers
+                    self.progress.emit(fraction, shown if fresh else None, model.duration)
+        except Exception as ex:
+            if not self.isInterruptionRequested():
+                self.failed.emit(str(ex))
+            return
+        for layer in model.layers:
+            if self.isInterruptionRequested():
+                return
+            layer.density  # build the zoomed-out pyramids here rather than on the first long-window paint
+        if not self.isInterruptionRequested():
+            self.loaded.emit(model)
+
+
+class LibraryIndexer(QThread):
+    """Scans the imports folder and indexes new or changed songs
+    (SongLibrary.scan/update) off the GUI thread. Emits `scanned` once the
+    file list is current, then `indexed` with the file name and entry as
+    each song is done."""
+    scanned = pyqtSignal()
+    indexed = pyqtSignal(str, object)
+
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.stop = threading.Event()
+
+    def run(self):
+        stale = self.library.scan()
+        self.scanned.emit()
+        self.library.update(stale, done=self.indexed.emit, stop=self.stop)
+
+
+class OutputOpener(QThread):
+    """Opens the default MIDI output device, or else the built-in sample
+    player, off the GUI thread: importing pygame and probing the devices
+    takes a while. Sets `output` (None: silent), `midi_clock` (pygame.midi.time
+    for a device) and `message` before it finishes."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.output = None
+        self.midi_clock = None
+        self.message = ''
+
+    def run(self):
+        import pygame
+        import pygame.midi
+        pygame.midi.init()
+        out_id = pygame.midi.get_default_output_id()
+        if out_id >= 0:
+            self.output = pygame.midi.Output(out_id, latency=OUTPUT_LATENCY_MS)
+            self.midi_clock = pygame.midi.time
+            return
+        # No MIDI device: fall back to the built-in sample player
+        synth = SynthOutput()
+        try:
+            synth.start()
+            self.output = synth
+            self.message = 'ℹ️  No MIDI output device – using the built-in piano samples'
+        except pygame.error as ex:
+            self.message = f'⚠️  No MIDI output device and no audio output ({ex}) – playback silent'
+
 
 # ────────────────────────────────────────────────────────────────────────────────
 # MAIN WINDOW
@@ -180,23 +390,25 @@ class MainWindow(QMainWindow):
             QApplication.instance().setWindowIcon(QIcon(icon_path))
         self.resize(1000, 720)
 
-        # MIDI out
-        pygame.midi.init()
-        out_id = pygame.midi.get_default_output_id()
-        if out_id >= 0:
-            self.midi_out = pygame.midi.Output(out_id)
-        else:
-            self.midi_out = None
-            print('⚠️  No MIDI output device – playback silent')
+        # MIDI out: opened after the first paint, see start_background_work
+        self.midi_out = None
+        self.output_opener = None  # OutputOpener running, if any
 
         # Data model
         self.model = MidiModel()
-        self.event_idx = 0
+        self.parse_cache = ParseCache(PARSE_CACHE_DIR)
+        self.library = SongLibrary(IMPORTS_DIR, LIBRARY_DIR, PARSE_CACHE_DIR)
+        self.indexer = None        # LibraryIndexer running, if any
+        self.rescan = False        # start another one when it finishes
+        self.song_icons = {}       # (thumbnail key, note color) -> QIcon
+        self.menu_stale = True     # music_menu needs rebuilding
+        self.loader = None  # MidiLoader of the song being loaded
+        self.scheduler = PlaybackScheduler()  # sends the events; the GUI only draws
+        self.event_idx = 0  # next schedule event to show on the keyboard
         self.elapsed = 0.0
-        self.last_time = 0.0
         self.speed = 1.0
-        self.loop = False
         self.playing = False
+        self.profiler = None
 
         # Layout
         central = QWidget(self)
@@ -206,8 +418,13 @@ class MainWindow(QMainWindow):
         vbox.setSpacing(0)
 
         self.canvas = PianoRollCanvas()
+        self.canvas.installEventFilter(self)  # until the first paint
         vbox.addWidget(self.canvas, 4)
 
+        self.overview = SongOverview(self.canvas)
+        self.overview.seek_requested.connect(self.seek_to)
+        vbox.addWidget(self.overview)
+
         self.keyboard = PianoKeyboardWidget(self.canvas.left_color.name(), self.canvas.right_color.name())
         vbox.addWidget(self.keyboard, 1)
 
@@ -232,8 +449,9 @@ class MainWindow(QMainWindow):
 
         hl.addWidget(QLabel('Window'))
         self.win_slider = QSlider(Qt.Horizontal)
-        self.win_slider.setRange(1, 20)
-        self.win_slider.setValue(5)
+        self.win_slider.setRange(0, len(WINDOW_STEPS) - 1)
+        self.win_slider.setValue(WINDOW_STEPS.index(5))
+        self.win_slider.setToolTip('5 s')
         self.win_slider.valueChanged.connect(self.change_window)
         hl.addWidget(self.win_slider)
 
@@ -246,22 +464,32 @@ class MainWindow(QMainWindow):
 
         self.loop_btn = QPushButton('Loop')
         self.loop_btn.setCheckable(True)
-        self.loop_btn.toggled.connect(lambda v: setattr(self, 'loop', v))
+        self.loop_btn.toggled.connect(lambda v: setattr(self.scheduler, 'loop', v))
         hl.addWidget(self.loop_btn)
 
         self.color_btn = QPushButton('Colors')
         self.color_btn.clicked.connect(self.choose_colors)
         hl.addWidget(self.color_btn)
 
+        self.tracks_btn = QToolButton()
+        self.tracks_btn.setText('Tracks')
+        self.tracks_btn.setPopupMode(QToolButton.InstantPopup)
+        self.tracks_menu = QMenu(self)
+        self.tracks_btn.setMenu(self.tracks_menu)
+        self.tracks_btn.setEnabled(False)
+        hl.addWidget(self.tracks_btn)
+
         self.filter_checkbox = QCheckBox("Activate filter")
         self.filter_checkbox.setChecked(False)
         self.filter_checkbox.stateChanged.connect(self.toggle_filter_sliders)
+        self.filter_checkbox.stateChanged.connect(self.apply_filter)
         hl.addWidget(self.filter_checkbox)
 
         self.vel_slider = QSlider(Qt.Horizontal)
         self.vel_slider.setRange(0, 127)
         self.vel_slider.setValue(20)
         self.vel_slider.setVisible(False)
+        self.vel_slider.valueChanged.connect(self.apply_filter)
         hl.addWidget(QLabel('Min. Velocity'))
         hl.addWidget(self.vel_slider)
 
@@ -269,20 +497,53 @@ class MainWindow(QMainWindow):
         self.dur_slider.setRange(1, 100)
         self.dur_slider.setValue(2)
         self.dur_slider.setVisible(False)
+        self.dur_slider.valueChanged.connect(self.apply_filter)
         hl.addWidget(QLabel('Min. duration (cs)'))
         hl.addWidget(self.dur_slider)
 
-        self.refresh_btn = QPushButton('Refresh')
-        self.refresh_btn.clicked.connect(self.refresh_filter)
-        hl.addWidget(self.refresh_btn)
-
         self.timer = QTimer(self)
         self.timer.setInterval(30)
         self.timer.timeout.connect(self.update_playback)
 
         self._init_menu()
-        self.load_files()
-        self.update_menu()
+
+    def eventFilter(self, obj, event):
+        if obj is self.canvas and event.type() == QEvent.Paint:
+            self.canvas.removeEventFilter(self)
+            startup_profiler.mark('first paint')
+            QTimer.singleShot(0, self.start_background_work)
+        return False
+
+    def start_background_work(self):
+        """What the first paint doesn't need: the output device and the library scan."""
+        opener = OutputOpener(self)
+        opener.finished.connect(self.output_opened)
+        self.output_opener = opener
+        opener.start()
+        self.refresh_library()
+
+    def output_opened(self):
+        """Hand the opened output to the scheduler. toggle_play calls this
+        early, waiting for the opener, if it is still at work."""
+        opener, self.output_opener = self.output_opener, None
+        if opener is None:
+            return
+        opener.wait()
+        opener.deleteLater()
+        if opener.message:
+            print(opener.message)
+        self.midi_out = opener.output
+        if opener.midi_clock is not None:
+            self.scheduler.set_output(self.midi_out, write_ahead=WRITE_AHEAD, latency=OUTPUT_LATENCY_MS,
+                                      midi_clock=opener.midi_clock)
+        else:
+            self.scheduler.set_output(self.midi_out)
+        self.preload_samples()
+        startup_profiler.mark('output ready')
+
+    def preload_samples(self):
+        if isinstance(self.midi_out, SynthOutput):
+            self.midi_out.bank.preload(np.unique(self.model.notes['note']).tolist())
 
     def _init_menu(self):
         self.gear_btn = QToolButton(self)
@@ -295,7 +556,16 @@ class MainWindow(QMainWindow):
         imp.triggered.connect(self.import_file)
         menu.addAction(imp)
         self.music_menu = QMenu('Piano music', self)
+        self.music_menu.aboutToShow.connect(self.update_menu)
         menu.addMenu(self.music_menu)
+        menu.addSeparator()
+        self.profile_action = QAction('Profiling overlay', self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.toggled.connect(self.toggle_profiling)
+        menu.addAction(self.profile_action)
+        save_profile = QAction('Save profile...', self)
+        save_profile.triggered.connect(self.save_profile)
+        menu.addAction(save_profile)
         self.gear_btn.setMenu(menu)
 
     def resizeEvent(self, event):
@@ -308,136 +578,357 @@ class MainWindow(QMainWindow):
         self.vel_slider.setVisible(show)
         self.dur_slider.setVisible(show)
 
-    def refresh_filter(self):
-        if hasattr(self, 'current_midi_path'):
-            self.load_midi(self.current_midi_path)
-        else:
-            QMessageBox.warning(self, 'No file', 'No MIDI file loaded.')
+    def filter_settings(self):
+        return self.filter_checkbox.isChecked(), self.vel_slider.value(), self.dur_slider.value() / 100.0
+
+    def apply_filter(self):
+        """Live re-filter of the loaded notes, no re-parse."""
+        if self.loader is not None:
+            return  # load_finished applies the current settings
+        self.model.set_filter(*self.filter_settings())
+        self.canvas.set_layers(self.model.layers)
+
+    def toggle_profiling(self, on):
+        self.profiler = FrameProfiler(self.timer.interval() / 1000.0) if on else None
+        self.canvas.profiler = self.keyboard.profiler = self.profiler
+        self.canvas.update()
+
+    def save_profile(self):
+        if self.profiler is None or not self.profiler.rows:
+            return QMessageBox.information(self, 'No profile', 'Turn on the profiling overlay and play a song first.')
+        path, _ = QFileDialog.getSaveFileName(self, 'Save profile', 'profile.csv', 'CSV (*.csv);;JSON (*.json)')
+        if path:
+            try:
+                self.profiler.dump(path)
+            except OSError as ex:
+                QMessageBox.critical(self, 'Save failed', str(ex))
 
     def import_file(self):
         path, _ = QFileDialog.getOpenFileName(self, 'Import MIDI', '', 'MIDI (*.mid)')
         if path:
+            import shutil
             dst = os.path.join(IMPORTS_DIR, os.path.basename(path))
             try:
+                os.makedirs(IMPORTS_DIR, exist_ok=True)
                 shutil.copy2(path, dst)
             except Exception as ex:
                 QMessageBox.critical(self, 'Copy failed', str(ex))
-            self.update_menu()
-
-    def load_files(self):
-        self.files = [os.path.join(IMPORTS_DIR, f) for f in os.listdir(IMPORTS_DIR) if f.lower().endswith('.mid')]
+            self.refresh_library()
+
+    def refresh_library(self):
+        """Pick up added, changed and removed files in the background."""
+        if self.indexer is not None:
+            self.rescan = True
+            return
+        indexer = LibraryIndexer(self.library, self)
+        indexer.scanned.connect(self.library_changed)
+        indexer.scanned.connect(lambda: startup_profiler.mark('library scanned'))
+        indexer.indexed.connect(self.library_changed)
+        indexer.finished.connect(lambda: self.indexing_finished(indexer))
+        self.indexer = indexer
+        indexer.start()
+
+    def library_changed(self, *_):
+        self.menu_stale = True
+
+    def indexing_finished(self, indexer):
+        indexer.deleteLater()
+        self.indexer = None
+        self.menu_stale = True  # the scan may only have removed files
+        if self.rescan:
+            self.rescan = False
+            self.refresh_library()
 
     def update_menu(self):
-        self.load_files()
+        """Rebuild the song menu from the library index, if it changed.
+        Big libraries are split into one lazily filled submenu per initial."""
+        if not self.menu_stale:
+            return
+        self.menu_stale = False
         self.music_menu.clear()
-        if not self.files:
+        songs = self.library.songs()
+        if not songs:
             a = QAction('(empty)', self)
             a.setEnabled(False)
             self.music_menu.addAction(a)
-        for p in self.files:
-            a = QAction(os.path.basename(p), self)
-            a.triggered.connect(lambda _, x=p: self.load_midi(x))
-            self.music_menu.addAction(a)
+        if len(songs) <= MENU_GROUP_OVER:
+            self.add_song_actions(self.music_menu, songs)
+            return
+        groups = {}
+        for name, entry in songs:
+            initial = name[:1].upper()
+            groups.setdefault(initial if initial.isalpha() else '#', []).append((name, entry))
+        for initial, group in sorted(groups.items()):
+            sub = self.music_menu.addMenu(f'{initial}  ({len(group)})')
+            sub.aboutToShow.connect(lambda sub=sub, group=group: self.fill_song_group(sub, group))
+
+    def fill_song_group(self, menu, songs):
+        if menu.isEmpty():
+            self.add_song_actions(menu, songs)
+
+    def add_song_actions(self, menu, songs):
+        for name, entry in songs:
+            if entry is None:
+                details = 'indexing…'
+            elif entry.get('error'):
+                details = 'unreadable'
+            else:
+                d = entry['duration']
+                details = f"{int(d // 60)}:{int(d % 60):02d} · {entry['notes']:,} notes · {entry['tempo']:g} BPM"
+            a = menu.addAction(f'{name}\t{details}')
+            if entry is not None and entry.get('key'):
+                a.setIcon(self.song_icon(entry))
+            a.triggered.connect(lambda _, x=self.library.path(name): self.load_midi(x))
+
+    def song_icon(self, entry):
+        color = self.canvas.right_color
+        icon = self.song_icons.get((entry['key'], color.rgba()))
+        if icon is None:
+            cells = self.library.thumbnail(entry)
+            icon = QIcon(QPixmap.fromImage(thumbnail_image(cells, color))) if cells is not None else QIcon()
+            self.song_icons[(entry['key'], color.rgba())] = icon
+        return icon
 
     def load_midi(self, path):
-        try:
-            filter_enabled = self.filter_checkbox.isChecked()
-            min_vel = self.vel_slider.value()
-            min_dur = self.dur_slider.value() / 100.0
-            self.model.load(path, filter_notes=filter_enabled, min_velocity=min_vel, min_duration=min_dur)
-        except Exception as ex:
-            return QMessageBox.critical(self, 'Parsing error', str(ex))
-
-        self.current_midi_path = path
+        """Parse `path` on a MidiLoader thread, cancelling any load in flight.
+        The roll shows the notes read so far; the new model replaces the
+        current one only once parsing succeeds."""
+        self.cancel_load()
+        if self.playing:
+            self.toggle_play()
+        loader = MidiLoader(path, self.parse_cache, self.filter_settings(), self)
+        loader.progress.connect(lambda *args: self.load_progress(loader, *args))
+        loader.loaded.connect(lambda model: self.load_finished(loader, model))
+        loader.failed.connect(lambda message: self.load_failed(loader, message))
+        loader.finished.connect(loader.deleteLater)
+        self.loader = loader
+        self.play_btn.setEnabled(False)
+        self.time_label.setText("Loading…")
+        loader.start()
+
+    def cancel_load(self):
+        if self.loader is not None:
+            self.loader.requestInterruption()
+            self.loader = None
+
+    def load_progress(self, loader, fraction, layers, duration):
+        if loader is not self.loader:
+            return  # signal queued before the load was cancelled
+        if layers is not None:
+            self.canvas.load_layers(layers, duration)
+        self.time_label.setText(f"Loading… {fraction:.0%}")
+
+    def load_failed(self, loader, message):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.play_btn.setEnabled(self.model.duration > 0)
+        self.canvas.load_layers(self.model.layers, self.model.duration)
+        self.canvas.set_time(self.elapsed)
+        t = self.elapsed
+        self.time_label.setText(f"{int(t//60)}:{int(t%60):02d} / {int(self.model.duration//60)}:{int(self.model.duration%60):02d}")
+        QMessageBox.critical(self, 'Parsing error', message)
+
+    def load_finished(self, loader, model):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.model = model
+        if loader.filter_settings != self.filter_settings():
+            self.model.set_filter(*self.filter_settings())  # changed while loading; apply_filter waited
+        self.scheduler.load(self.model.routed_schedule(), self.model.duration)
+        self.preload_samples()
+        self.current_midi_path = loader.path
         self.event_idx = 0
         self.elapsed = 0.0
-        self.play_btn.setEnabled(True)
-        self.canvas.load_notes(self.model.notes, self.model.duration)
+        self.play_btn.setEnabled(self.model.duration > 0)  # nothing to play in a file without notes
+        self.canvas.load_layers(self.model.layers, self.model.duration)
+        self.update_tracks_menu()
         self.time_label.setText(f"0:00 / {int(self.model.duration // 60)}:{int(self.model.duration % 60):02d}")
 
+    def update_tracks_menu(self):
+        """One submenu per layer of the loaded song; filled when opened."""
+        self.tracks_menu.clear()
+        for layer in self.model.layers:
+            sub = self.tracks_menu.addMenu(layer.name)
+            sub.aboutToShow.connect(lambda sub=sub, layer=layer: self.fill_layer_menu(sub, layer))
+        self.tracks_menu.addSeparator()
+        self.tracks_menu.addAction('Show all', lambda: self.show_layers(True))
+        self.tracks_menu.addAction('Hide all', lambda: self.show_layers(False))
+        self.tracks_btn.setEnabled(len(self.model.layers) > 0)
+
+    def fill_layer_menu(self, menu, layer):
+        menu.clear()
+        show = menu.addAction('Show')
+        show.setCheckable(True)
+        show.setChecked(layer.visible)
+        show.toggled.connect(lambda on: self.set_layer(layer, visible=on))
+        menu.addAction('Color...', lambda: self.choose_layer_color(layer))
+        hand = menu.addAction('Hand colors', lambda: self.set_layer(layer, color=None))
+        hand.setEnabled(layer.color is not None)
+
+        channels = menu.addMenu('Output channel')
+        group = QActionGroup(channels)
+        for channel in range(16):
+            action = channels.addAction(f'Channel {channel + 1}', lambda c=channel: self.set_layer(layer, out_channel=c))
+            action.setCheckable(True)
+            action.setChecked(layer.out_channel == channel)
+            group.addAction(action)
+
+        programs = menu.addMenu('Instrument')
+        group = QActionGroup(programs)
+        follow = programs.addAction('As in file', lambda: self.set_layer(layer, program=None))
+        for family, name in enumerate(GM_FAMILIES):
+            family_menu = programs.addMenu(name)
+            for program in range(family * 8, family * 8 + 8):
+                action = family_menu.addAction(program_name(program),
+                                               lambda p=program: self.set_layer(layer, program=p))
+                action.setCheckable(True)
+                action.setChecked(layer.program == program)
+                group.addAction(action)
+        follow.setCheckable(True)
+        follow.setChecked(layer.program is None)
+        group.addAction(follow)
+
+    def choose_layer_color(self, layer):
+        color = QColorDialog.getColor(QColor(layer.color or self.canvas.right_color), self, layer.name)
+        if color.isValid():
+            self.set_layer(layer, color=color.name())
+
+    def set_layer(self, layer, **settings):
+        """Change Layer attributes; routing changes re-route playback in place."""
+        routing = {'out_channel', 'program'} & settings.keys()
+        for name, value in settings.items():
+            setattr(layer, name, value)
+        if routing:
+            self.scheduler.reroute(self.model.routed_schedule())
+        self.canvas.update()
+
+    def show_layers(self, on):
+        for layer in self.model.layers:
+            layer.visible = on
+        self.canvas.update()
+
+    def closeEvent(self, event):
+        self.cancel_load()
+        for loader in self.findChildren(MidiLoader):
+            loader.wait()
+        for builder in self.findChildren(DensityBuilder):
+            builder.requestInterruption()
+            builder.wait()
+        if self.indexer is not None:
+            self.indexer.stop.set()
+            self.indexer.wait()
+        if self.output_opener is not None:
+            self.output_opener.wait()
+        self.scheduler.close()
+        super().closeEvent(event)
+
     def toggle_play(self):
         if self.playing:
-            self.elapsed += (time.time() - self.last_time) * self.speed
+            self.scheduler.pause()
             self.timer.stop()
             self.play_btn.setText('▶')
         else:
-            self.last_time = time.time()
+            self.output_opened()  # the device must be ready for the first Play
+            self.scheduler.play()
+            if self.profiler is not None:
+                self.profiler.timer_started()
             self.timer.start()
             self.play_btn.setText('⏸')
         self.playing = not self.playing
 
     def update_playback(self):
-        now = time.time()
-        dt = (now - self.last_time) * self.speed
-        self.elapsed += dt
-        self.last_time = now
-
-        if self.elapsed >= self.model.duration:
-            if self.loop:
-                self.elapsed = 0.0
-                self.event_idx = 0
-            else:
-                return self.toggle_play()
-
-        t = self.elapsed
-        while self.event_idx < len(self.model.schedule) and self.model.schedule[self.event_idx]['time'] <= t:
-            ev = self.model.schedule[self.event_idx]
-            typ = ev['type']
-            if typ in ('on', 'off'):
-                note = ev['note']
-                vel = ev['velocity'] if typ == 'on' else 0
-                if self.midi_out:
-                    if typ == 'on': self.midi_out.note_on(note, vel)
-                    else: self.midi_out.note_off(note, vel)
-                self.keyboard.setPressed(note, typ == 'on')
-            elif typ == 'pedal':
-                self.canvas.set_pedal_state(ev['value'] >= 64)
-            self.event_idx += 1
+        """Display only: follow the scheduler's position on the keyboard and roll."""
+        t = self.scheduler.position()
+        if self.scheduler.finished:
+            self.toggle_play()  # stopped at the end; the last position is still drawn below
+        end_idx = int(np.searchsorted(self.model.schedule_times, t, side='right'))
+        if t < self.elapsed:  # looped back to the start
+            self.event_idx = end_idx
+            self.keyboard.pressed, pedal = self.model.seek_index.state_at(end_idx)
+            self.keyboard.update()
+            self.canvas.set_pedal_state(pedal >= 64)
+        self.elapsed = t
+        if self.profiler is not None:
+            self.profiler.tick(t, max(end_idx - self.event_idx, 0))
+        events = self.model.schedule[self.event_idx:end_idx]
+        for typ, note, value in zip(events['type'].tolist(), events['note'].tolist(), events['value'].tolist()):
+            if typ in (EV_ON, EV_OFF):
+                self.keyboard.setPressed(note, typ == EV_ON, flush=False)
+            elif typ == EV_PEDAL:
+                self.canvas.set_pedal_state(value >= 64)
+        self.event_idx = max(self.event_idx, end_idx)
+        self.keyboard.flush()
 
         self.canvas.set_time(t)
-        self.pos_slider.setValue(int(t / self.model.duration * 1000))
+        if self.model.duration > 0:
+            self.pos_slider.setValue(int(t / self.model.duration * 1000))
         self.time_label.setText(f"{int(t//60)}:{int(t%60):02d} / {int(self.model.duration//60)}:{int(self.model.duration%60):02d}")
 
     def seek(self, val):
-        self.elapsed = (val / 1000.0) * self.model.duration
-        self.last_time = time.time()
-        self.event_idx = 0
-        self.keyboard.pressed.clear()
-        for e in self.model.schedule:
-            if e['time'] <= self.elapsed:
-                if e['type'] == 'on':
-                    self.keyboard.pressed.add(e['note'])
-                elif e['type'] == 'off':
-                    self.keyboard.pressed.discard(e['note'])
-                self.event_idx += 1
-            else:
-                break
+        self.seek_to((val / 1000.0) * self.model.duration)
+
+    def seek_to(self, t):
+        self.elapsed = t
+        if not self.pos_slider.isSliderDown() and self.model.duration > 0:
+            self.pos_slider.setValue(int(t / self.model.duration * 1000))
+        self.scheduler.seek(self.elapsed)
+        self.event_idx = int(np.searchsorted(self.model.schedule_times, self.elapsed, side='right'))
+        self.keyboard.pressed, pedal = self.model.seek_index.state_at(self.event_idx)
         self.keyboard.update()
+        self.canvas.set_pedal_state(pedal >= 64)
         self.canvas.set_time(self.elapsed)
 
-    def change_window(self, val):
-        self.canvas.time_window = float(val)
+    def change_window(self, index):
+        self.canvas.time_window = float(WINDOW_STEPS[index])
+        self.win_slider.setToolTip(f'{WINDOW_STEPS[index]} s')
         self.canvas.update()
 
     def change_speed(self, val):
         self.speed = val / 100.0
+        self.scheduler.set_speed(self.speed)
         self.time_label.setText(f"{self.speed:.2f}x")
 
     def choose_colors(self):
         left = QColorDialog.getColor(self.keyboard.left_color, self, 'Choose color for bass notes')
-        if left.isValid():
-            self.keyboard.left_color = left
-            self.canvas.left_color = left
+        if not left.isValid():
+            left = self.keyboard.left_color
         right = QColorDialog.getColor(self.keyboard.right_color, self, 'Choose color for high notes')
-        if right.isValid():
-            self.keyboard.right_color = right
-            self.canvas.right_color = right
-        self.keyboard.update()
-        self.canvas.update()
+        if not right.isValid():
+            right = self.keyboard.right_color
+        self.keyboard.set_colors(left, right)
+        self.canvas.set_colors(left, right)
+        self.menu_stale = True  # thumbnails use the note color
+
+def report_startup(app, window, budget):
+    """--startup-profile: once the device is open and the library scanned,
+    print the launch timings and quit, with status 1 over the budget."""
+    if not {'output ready', 'library scanned'} <= startup_profiler.marks.keys():
+        return QTimer.singleShot(10, lambda: report_startup(app, window, budget))
+    print(startup_profiler.report(budget=budget))
+    window.close()
+    app.exit(1 if startup_profiler.marks['first paint'] * 1000 > budget else 0)
+
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()  # library indexing workers in the .exe
+    import argparse
+    parser = argparse.ArgumentParser(description='Piano roll player.')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Print the launch phase and import timings once started, then quit')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS,
+                        help='Time to first paint allowed by --startup-profile, ms (exit status 1 when over)')
+    args, qt_args = parser.parse_known_args()
+    lower_switch_interval()  # keeps painting from delaying the scheduler thread
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup_profiler.mark('QApplication')
     window = MainWindow()
+    startup_profiler.mark('main window')
     window.showMaximized()
+    if args.startup_profile:
+        report_startup(app, window, args.startup_budget)
     sys.exit(app.exec_())
              
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+midimodel.py: Playback/display model shared by the GUI (main.py) and the
+headless exporter (export.py). Holds the parsed note and schedule tables.
+midiparser (and mido) is only imported once a file is parsed, which keeps
+it off the GUI's startup path.
+"""
+import numpy as np
+
+from layers import LayerSet
+from notetable import (
+    SCHEDULE_DTYPE, NoteFilter, SeekIndex, empty_notes, empty_schedule, filter_notes, notes_from_rows,
+    schedule_duration,
+)
+
+
+class MidiModel:
+    def __init__(self):
+        self.set_tables(empty_notes(), empty_schedule())
+        self.notes = self.all_notes
+
+    def load(self, path: str, *, filter_notes=False, min_velocity=20, min_duration=0.02, cache=None):
+        """cache: optional parsecache.ParseCache to skip re-parsing known files."""
+        from midiparser import parse_midi_tables
+        data = cache.parse(path) if cache is not None else parse_midi_tables(path)
+        self.set_tables(data['notes'], data['playback_schedule'])
+        self.set_filter(filter_notes, min_velocity, min_duration)
+
+    def stream(self, path: str, *, chunk_events=50000, progress_events=10000, filter_notes=False,
+               min_velocity=20, min_duration=0.02, cache=None):
+        """Incremental load: a generator that parses `path` with iter_midi,
+        yielding the fraction read every `progress_events` events (a chance to
+        stop early). Rows are converted to arrays every `chunk_events` events,
+        and the notes parsed so far are shown (all_notes, notes, layers and
+        duration only) each time the count has doubled since the last time.
+        Notes appear once they end; the final tables equal load()'s."""
+        key, tables = cache.lookup(path) if cache is not None else (None, None)
+        if tables is None:
+            from midiparser import iter_midi
+            note_rows, schedule_rows = [], []
+            rows = {'note': note_rows, 'event': schedule_rows}
+            note_parts, schedule_parts = [], []  # the rows converted so far, one array per chunk
+            read = converted = shown = 0
+            for kind, item in iter_midi(path, progress_every=progress_events):
+                if kind in rows:
+                    rows[kind].append(item)
+                elif kind == 'progress':
+                    read += progress_events
+                    if read - converted >= chunk_events:
+                        note_parts.append(notes_from_rows(note_rows))
+                        schedule_parts.append(np.array(schedule_rows, dtype=SCHEDULE_DTYPE))
+                        note_rows.clear()
+                        schedule_rows.clear()
+                        converted = read
+                        # A view is built from every note so far; doubling the gap keeps the total linear
+                        if converted >= 2 * shown:
+                            shown = converted
+                            self._show_partial(np.concatenate(note_parts), np.concatenate(schedule_parts),
+                                               filter_notes, min_velocity, min_duration)
+                    yield item
+            notes = np.concatenate(note_parts + [notes_from_rows(note_rows)])
+            events = np.concatenate(schedule_parts + [np.array(schedule_rows, dtype=SCHEDULE_DTYPE)])
+            tables = {'notes': notes, 'playback_schedule': events[np.argsort(events['time'], kind='stable')]}
+            if cache is not None:
+                cache.save(key, tables)
+        self.set_tables(tables['notes'], tables['playback_schedule'])
+        self.set_filter(filter_notes, min_velocity, min_duration)
+        yield 1.0
+
+    def _show_partial(self, notes, schedule, enabled, min_velocity, min_duration):
+        """stream(): display the notes read so far. The playback tables, seek
+        index and note filter are only built for the complete song."""
+        self.all_notes = notes
+        self.duration = schedule_duration(schedule)
+        self.layers = LayerSet(notes, schedule)
+        self.notes = filter_notes(notes, min_velocity, min_duration) if enabled else notes
+        if enabled:
+            self.layers.set_notes(self.notes)
+
+    def set_tables(self, notes, schedule):
+        self.all_notes = notes            # unfiltered, see notetable.NOTE_DTYPE
+        self.note_filter = NoteFilter(notes)
+        self.schedule = schedule          # see notetable.SCHEDULE_DTYPE
+        self.schedule_times = np.ascontiguousarray(schedule['time'])
+        self.seek_index = SeekIndex(schedule)
+        self.duration = schedule_duration(schedule)
+        self.layers = LayerSet(notes, schedule)  # indexes the displayed notes, see set_filter
+
+    def set_filter(self, enabled, min_velocity=20, min_duration=0.02):
+        """Re-filter the displayed notes in memory; playback is never filtered."""
+        self.notes = self.note_filter(min_velocity, min_duration) if enabled else self.all_notes
+        self.layers.set_notes(self.notes)
+        return self.notes
+
+    def routed_schedule(self):
+        """The schedule with the layers' output channels and programs applied."""
+        return self.layers.route(self.schedule)
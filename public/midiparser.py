@@ -11,147 +11,485 @@ Extracts:
 - Accurate playback schedule
 """
 import mido
+import numpy as np
 import json
 import argparse
+import glob
+import os
+import tempfile
+import sys
+import time
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def parse_midi(file_path):
-    mid = mido.MidiFile(file_path)
-    ticks_per_beat = mid.ticks_per_beat
-
-    # Build tempo map: list of (tick, tempo)
-    tempo_events = [(0, 500000)]  # default tempo = 120 BPM
-
-    raw_events = []  # (tick, msg, track)
-    for i, track in enumerate(mid.tracks):
-        tick = 0
-        for msg in track:
-            tick += msg.time
-            raw_events.append((tick, msg, i))
-            if msg.type == 'set_tempo':
-                tempo_events.append((tick, msg.tempo))
-
-    tempo_events.sort()
-    raw_events.sort(key=lambda x: x[0])
-
-    def tick_to_seconds(target_tick):
-        seconds = 0.0
-        last_tick = 0
-        last_tempo = tempo_events[0][1]
-        for t, tempo in tempo_events[1:]:
-            if target_tick < t:
-                break
-            delta_ticks = t - last_tick
-            seconds += mido.tick2second(delta_ticks, ticks_per_beat, last_tempo)
-            last_tick = t
-            last_tempo = tempo
-        delta_ticks = target_tick - last_tick
-        seconds += mido.tick2second(delta_ticks, ticks_per_beat, last_tempo)
-        return seconds
-
-    notes = []
-    active_notes = {}
-    pedals = {'sustain': [], 'expression': []}
-    tempo_changes = []
-    time_signatures = []
-    key_signatures = []
-    program_changes = []
-    playback_schedule = []
-
-    for tick, msg, track_idx in raw_events:
-        time_sec = tick_to_seconds(tick)
-
-        if msg.type == 'set_tempo':
-            tempo_changes.append({
-                'time': time_sec,
-                'tempo': mido.tempo2bpm(msg.tempo)
-            })
+from notetable import (
+    EV_OFF, EV_ON, EV_PEDAL, EV_PROGRAM, NOTE_DTYPE, SCHEDULE_DTYPE,
+    notes_from_rows, schedule_from_rows, notes_to_dicts, schedule_to_dicts,
+)
+
+IMPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imports')
+
+# Bump whenever the parse output changes; invalidates parsecache entries
+PARSER_VERSION = 4
+
+# Open notes kept per (channel, key); a further note-on cuts the oldest one
+MAX_OPEN_PER_KEY = 64
+# Yielded by the track decoders after a track's last event, at its tick
+END_OF_TRACK = 'end_of_track'
+
+
+# Meta events the parser reads; every other meta event is skipped undecoded
+META_TYPES = {0x51, 0x58, 0x59}
+# Total length of the system messages that may appear in a track chunk
+SYSTEM_LENGTHS = {0xF1: 2, 0xF2: 3, 0xF3: 2, 0xF6: 1, 0xF8: 1, 0xFA: 1, 0xFB: 1, 0xFC: 1, 0xFE: 1}
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _decode_track(data, track_idx, consumed):
+    """Lazily decode one MTrk chunk body into (tick, track, msg) in file order.
+    msg is a (status, data1, data2) tuple for channel messages or a
+    mido.MetaMessage for META_TYPES; everything else is skipped.
+    consumed[track_idx] follows the read position, for progress reporting."""
+    pos, end, tick, running = 0, len(data), 0, None
+    try:
+        while pos < end:
+            delta, pos = _read_varlen(data, pos)
+            tick += delta
+            status = data[pos]
+            if status < 0x80:
+                if running is None:
+                    raise OSError('running status without last_status')
+                status = running
+            else:
+                pos += 1
+            if status == 0xFF:
+                meta_start = pos - 1
+                length, body = _read_varlen(data, pos + 1)
+                pos = body + length
+                if pos > end:
+                    raise EOFError(f'track {track_idx} ends mid-message')
+                if data[meta_start + 1] in META_TYPES:
+                    yield tick, track_idx, mido.MetaMessage.from_bytes(data[meta_start:pos])
+            elif status in (0xF0, 0xF7):
+                length, pos = _read_varlen(data, pos)
+                pos += length
+                running = None
+            elif status >= 0xF0:
+                if status not in SYSTEM_LENGTHS:
+                    raise OSError(f'undefined status byte 0x{status:02x}')
+                pos += SYSTEM_LENGTHS[status] - 1
+            else:
+                running = status
+                if status & 0xE0 == 0xC0:  # program change, channel pressure
+                    data1, data2 = data[pos], 0
+                    pos += 1
+                else:
+                    data1, data2 = data[pos], data[pos + 1]
+                    pos += 2
+                if data1 > 127 or data2 > 127:
+                    raise OSError('data byte must be in range 0..127')
+                yield tick, track_idx, (status, data1, data2)
+            consumed[track_idx] = pos
+    except IndexError:
+        raise EOFError(f'track {track_idx} ends mid-message') from None
+    if pos > end:
+        raise EOFError(f'track {track_idx} ends mid-message')
+    yield tick, track_idx, END_OF_TRACK
+
+
+def _mido_track(track, track_idx, consumed):
+    """Same stream as _decode_track, for an already loaded mido.MidiTrack."""
+    tick = 0
+    for i, msg in enumerate(track):
+        tick += msg.time
+        if msg.type in ('note_on', 'note_off', 'control_change'):
+            yield tick, track_idx, tuple(msg.bytes())
+        elif msg.type == 'program_change':
+            yield tick, track_idx, (0xC0 | msg.channel, msg.program, 0)
+        elif msg.type in ('set_tempo', 'time_signature', 'key_signature'):
+            yield tick, track_idx, msg
+        consumed[track_idx] = i + 1
+    yield tick, track_idx, END_OF_TRACK
+
+
+def _open_tracks(source):
+    """(ticks_per_beat, per-track event streams, consumed, total) for a path or
+    a mido.MidiFile. Files are only split into track chunks here; messages are
+    decoded as the streams are consumed."""
+    if isinstance(source, mido.MidiFile):
+        consumed = [0] * len(source.tracks)
+        streams = [_mido_track(track, i, consumed) for i, track in enumerate(source.tracks)]
+        return source.ticks_per_beat, streams, consumed, sum(len(track) for track in source.tracks)
+    with open(source, 'rb') as f:
+        data = memoryview(f.read())
+    if len(data) < 14 or data[:4] != b'MThd':
+        raise OSError('MThd not found. Probably not a MIDI file')
+    header_size = int.from_bytes(data[4:8], 'big')
+    num_tracks = int.from_bytes(data[10:12], 'big')
+    ticks_per_beat = int.from_bytes(data[12:14], 'big', signed=True)
+    pos = 8 + header_size
+    chunks = []
+    for i in range(num_tracks):
+        if pos + 8 > len(data):
+            raise EOFError(f'file ends before track {i}')
+        if data[pos:pos + 4] != b'MTrk':
+            raise OSError('no MTrk header at start of track')
+        size = int.from_bytes(data[pos + 4:pos + 8], 'big')
+        if pos + 8 + size > len(data):
+            raise EOFError(f'file ends inside track {i}')
+        chunks.append(data[pos + 8:pos + 8 + size])
+        pos += 8 + size
+    consumed = [0] * len(chunks)
+    streams = [_decode_track(chunk, i, consumed) for i, chunk in enumerate(chunks)]
+    return ticks_per_beat, streams, consumed, sum(len(chunk) for chunk in chunks)
+
+
+def iter_midi(source, progress_every=0, pairing='fifo'):
+    """Streaming core of the parser. Tracks are already in tick order, so a
+    k-way merge of the per-track streams (ties in track order, as a stable
+    global sort would give) visits every event in time order without
+    materializing them. Tempo changes arrive in that same order, so seconds are
+    accumulated on the fly.
+
+    Every (channel, key) keeps a queue of its open notes, so re-struck keys
+    lose nothing: a note-off ends the oldest open note ('fifo') or the most
+    recent one ('lifo'). A note-on beyond MAX_OPEN_PER_KEY open notes ends
+    the oldest there (with a note-off in the schedule), which bounds memory
+    whatever the file. Notes a track
+    leaves open end with it (and get a note-off in the schedule). Each
+    event costs O(1), plus the flush at each track end.
+
+    Yields (kind, item):
+      ('ticks_per_beat', int)   first, once
+      ('note', row)             (start, end, note, velocity, channel, track) when the note ends
+      ('event', row)            playback schedule row (time, type, note, value, channel, track),
+                                in time order
+      ('tempo_change' | 'time_signature' | 'key_signature' | 'program_change'
+       | 'sustain' | 'expression', dict)   as in parse_midi
+      ('progress', fraction)    every `progress_every` events, if > 0
+    """
+    ticks_per_beat, streams, consumed, total = _open_tracks(source)
+    yield 'ticks_per_beat', ticks_per_beat
+
+    # Current tempo segment: starts at seg_tick, seg_seconds into the song
+    seg_tick, seg_seconds, tempo = 0, 0.0, 500000  # default tempo = 120 BPM
+    if pairing not in ('fifo', 'lifo'):
+        raise ValueError(f'unknown pairing {pairing!r}')
+    fifo = pairing == 'fifo'
+    active_notes = {}  # (channel, key) -> deque of open (start, velocity, track), oldest first
+    track_keys = {}    # track -> keys it opened notes on, for the end-of-track flush
+    count = 0
+    for tick, track_idx, msg in heapq.merge(*streams, key=lambda event: event[0]):
+        time_sec = seg_seconds + mido.tick2second(tick - seg_tick, ticks_per_beat, tempo)
+
+        if type(msg) is tuple:
+            status, data1, data2 = msg
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind == 0x90 and data2 > 0:
+                key = (channel, data1)
+                open_notes = active_notes.get(key)
+                if open_notes is None:
+                    open_notes = active_notes[key] = deque()
+                elif len(open_notes) >= MAX_OPEN_PER_KEY:
+                    start, velocity, note_track = open_notes.popleft()
+                    yield 'note', (start, time_sec, data1, velocity, channel, note_track)
+                    yield 'event', (time_sec, EV_OFF, data1, 0, channel, note_track)
+                open_notes.append((time_sec, data2, track_idx))
+                keys = track_keys.get(track_idx)
+                if keys is None:
+                    keys = track_keys[track_idx] = set()
+                keys.add(key)
+                yield 'event', (time_sec, EV_ON, data1, data2, channel, track_idx)
+            elif kind == 0x80 or kind == 0x90:
+                open_notes = active_notes.get((channel, data1))
+                note_track = track_idx
+                if open_notes:
+                    start, velocity, note_track = open_notes.popleft() if fifo else open_notes.pop()
+                    yield 'note', (start, time_sec, data1, velocity, channel, note_track)
+                # Filed under the note's track, so both ends route the same way
+                yield 'event', (time_sec, EV_OFF, data1, 0, channel, note_track)
+            elif kind == 0xB0:
+                if data1 == 64:
+                    yield 'sustain', {'time': time_sec, 'value': data2}
+                    yield 'event', (time_sec, EV_PEDAL, 0, data2, channel, track_idx)
+                elif data1 == 11:
+                    yield 'expression', {'time': time_sec, 'value': data2}
+            elif kind == 0xC0:
+                yield 'program_change', {'time': time_sec, 'channel': channel, 'program': data1}
+                yield 'event', (time_sec, EV_PROGRAM, 0, data1, channel, track_idx)
+
+        elif msg is END_OF_TRACK:
+            for key in sorted(track_keys.pop(track_idx, ())):
+                open_notes = active_notes.get(key)
+                if not open_notes:
+                    continue
+                channel, note = key
+                kept = deque()
+                for start, velocity, note_track in open_notes:
+                    if note_track == track_idx:
+                        yield 'note', (start, time_sec, note, velocity, channel, note_track)
+                        yield 'event', (time_sec, EV_OFF, note, 0, channel, note_track)
+                    else:
+                        kept.append((start, velocity, note_track))
+                active_notes[key] = kept
+
+        elif msg.type == 'set_tempo':
+            seg_tick, seg_seconds, tempo = tick, time_sec, msg.tempo
+            yield 'tempo_change', {'time': time_sec, 'tempo': mido.tempo2bpm(msg.tempo)}
 
         elif msg.type == 'time_signature':
-            time_signatures.append({
-                'time': time_sec,
-                'numerator': msg.numerator,
-                'denominator': msg.denominator
-            })
+            yield 'time_signature', {'time': time_sec, 'numerator': msg.numerator, 'denominator': msg.denominator}
 
         elif msg.type == 'key_signature':
-            key_signatures.append({
-                'time': time_sec,
-                'key': msg.key
-            })
+            yield 'key_signature', {'time': time_sec, 'key': msg.key}
 
-        elif msg.type == 'program_change':
-            program_changes.append({
-                'time': time_sec,
-                'channel': msg.channel,
-                'program': msg.program
-            })
-
-        elif msg.type == 'control_change':
-            if msg.control == 64:
-                pedals['sustain'].append({'time': time_sec, 'value': msg.value})
-                playback_schedule.append({
-                    'time': time_sec,
-                    'type': 'pedal',
-                    'value': msg.value
-                })
-            elif msg.control == 11:
-                pedals['expression'].append({'time': time_sec, 'value': msg.value})
-
-        elif msg.type == 'note_on' and msg.velocity > 0:
-            key = (msg.channel, msg.note)
-            active_notes[key] = {
-                'note': msg.note,
-                'start': time_sec,
-                'velocity': msg.velocity,
-                'channel': msg.channel,
-                'track': track_idx
-            }
-            playback_schedule.append({
-                'time': time_sec,
-                'type': 'on',
-                'note': msg.note,
-                'velocity': msg.velocity
-            })
-
-        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-            key = (msg.channel, msg.note)
-            note_info = active_notes.pop(key, None)
-            if note_info:
-                notes.append({
-                    'note': msg.note,
-                    'start': note_info['start'],
-                    'end': time_sec,
-                    'velocity': note_info['velocity'],
-                    'channel': note_info['channel'],
-                    'track': note_info['track']
-                })
-            playback_schedule.append({
-                'time': time_sec,
-                'type': 'off',
-                'note': msg.note,
-                'velocity': 0
-            })
-
-    playback_schedule.sort(key=lambda x: x['time'])
+        count += 1
+        if progress_every and count % progress_every == 0:
+            yield 'progress', sum(consumed) / total if total else 1.0
+
+
+def _parse_rows(file_path, pairing='fifo'):
+    """Collects iter_midi into the lists shared by parse_midi and
+    parse_midi_tables. Notes and schedule entries come back as plain tuples
+    matching the notetable column order."""
+    data = {
+        'ticks_per_beat': None,
+        'tempo_changes': [],
+        'time_signatures': [],
+        'key_signatures': [],
+        'program_changes': [],
+        'note_rows': [],
+        'pedals': {'sustain': [], 'expression': []},
+        'schedule_rows': [],
+    }
+    lists = {
+        'note': data['note_rows'],
+        'event': data['schedule_rows'],
+        'tempo_change': data['tempo_changes'],
+        'time_signature': data['time_signatures'],
+        'key_signature': data['key_signatures'],
+        'program_change': data['program_changes'],
+        'sustain': data['pedals']['sustain'],
+        'expression': data['pedals']['expression'],
+    }
+    for kind, item in iter_midi(file_path, pairing=pairing):
+        if kind == 'ticks_per_beat':
+            data['ticks_per_beat'] = item
+        else:
+            lists[kind].append(item)
+    return data
+
+
+def parse_midi_tables(file_path, pairing='fifo'):
+    """Same as parse_midi, but 'notes' and 'playback_schedule' are NumPy
+    structured arrays (see notetable.NOTE_DTYPE / SCHEDULE_DTYPE)."""
+    data = _parse_rows(file_path, pairing)
+    data['notes'] = notes_from_rows(data.pop('note_rows'))
+    data['playback_schedule'] = schedule_from_rows(data.pop('schedule_rows'))
+    return data
 
+
+def parse_midi(file_path, pairing='fifo'):
+    """pairing: how note-offs match re-struck keys, see iter_midi."""
+    data = parse_midi_tables(file_path, pairing)
     return {
-        'ticks_per_beat': ticks_per_beat,
-        'tempo_changes': tempo_changes,
-        'time_signatures': time_signatures,
-        'key_signatures': key_signatures,
-        'program_changes': program_changes,
-        'notes': notes,
-        'pedals': pedals,
-        'playback_schedule': playback_schedule
+        'ticks_per_beat': data['ticks_per_beat'],
+        'tempo_changes': data['tempo_changes'],
+        'time_signatures': data['time_signatures'],
+        'key_signatures': data['key_signatures'],
+        'program_changes': data['program_changes'],
+        'notes': notes_to_dicts(data['notes']),
+        'pedals': data['pedals'],
+        'playback_schedule': schedule_to_dicts(data['playback_schedule'])
     }
 
+def make_tempo_stress_midi(tempo_events=100000, notes=10000, ticks_per_beat=480):
+    """Synthetic file with dense tempo automation, used by the benchmark mode."""
+    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+    tempo_track = mido.MidiTrack()
+    for i in range(tempo_events):
+        tempo_track.append(mido.MetaMessage('set_tempo', tempo=400000 + (i % 200) * 1000, time=0 if i == 0 else 1))
+    note_track = mido.MidiTrack()
+    step = max(tempo_events // max(notes, 1), 1)
+    for i in range(notes):
+        n = 21 + i % 88
+        note_track.append(mido.Message('note_on', note=n, velocity=64, time=0 if i == 0 else step // 2))
+        note_track.append(mido.Message('note_off', note=n, velocity=0, time=step - step // 2))
+    mid.tracks.extend([tempo_track, note_track])
+    return mid
+
+
+def benchmark(paths, repeat=3):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic = os.path.join(tmp, 'synthetic-100k-tempo.mid')
+        make_tempo_stress_midi().save(synthetic)
+        for path in list(paths) + [synthetic]:
+            events = sum(len(track) for track in mido.MidiFile(path).tracks)
+            best = float('inf')
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                parse_midi(path)
+                best = min(best, time.perf_counter() - t0)
+            results.append((os.path.basename(path), events, best))
+            print(f'{os.path.basename(path):<60} {events:>8} events  {best * 1000:9.1f} ms  {events / best:>12,.0f} events/s')
+    return results
+
+
+COLUMN_TABLES = {'notes': NOTE_DTYPE, 'playback_schedule': SCHEDULE_DTYPE}
+
+
+def save_columns(path, data):
+    """Write parse_midi_tables output as an .npz archive: one array per table
+    column ('notes.start', 'playback_schedule.time', ...) plus the remaining
+    metadata as UTF-8 JSON bytes under 'meta'."""
+    arrays = {f'{table}.{field}': np.ascontiguousarray(data[table][field])
+              for table, dtype in COLUMN_TABLES.items() for field in dtype.names}
+    meta = {k: v for k, v in data.items() if k not in COLUMN_TABLES}
+    arrays['meta'] = np.frombuffer(json.dumps(meta, separators=(',', ':')).encode(), dtype=np.uint8)
+    np.savez(path, **arrays)
+
+
+def load_columns(path):
+    """Inverse of save_columns: parse_midi_tables-style dict."""
+    with np.load(path) as archive:
+        data = json.loads(archive['meta'].tobytes())
+        for table, dtype in COLUMN_TABLES.items():
+            columns = {field: archive[f'{table}.{field}'] for field in dtype.names}
+            rows = len(columns[dtype.names[0]])
+            data[table] = np.empty(rows, dtype=dtype)
+            for field, column in columns.items():
+                data[table][field] = column
+    return data
+
+
+def expand_inputs(patterns):
+    """MIDI files named by `patterns`: files, directories (searched
+    recursively) or glob patterns, in a stable order without duplicates."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(root, name)
+                       for root, _, names in os.walk(pattern) for name in names
+                       if name.lower().endswith(('.mid', '.midi'))]
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            matches = [pattern]
+        paths.extend(sorted(matches))
+    return list(dict.fromkeys(paths))
+
+
+def _batch_parse(path, fmt, destination):
+    """Worker: parse one file. JSON Lines output is serialized here and
+    returned; columnar output is written straight to `destination`."""
+    t0 = time.perf_counter()
+    if fmt == 'jsonl':
+        data = parse_midi(path)
+        line = json.dumps({'file': path, **data}, separators=(',', ':'))
+        notes, events = len(data['notes']), len(data['playback_schedule'])
+    else:
+        data = parse_midi_tables(path)
+        save_columns(destination, data)
+        line = None
+        notes, events = len(data['notes']), len(data['playback_schedule'])
+    return line, notes, events, time.perf_counter() - t0
+
+
+def batch(paths, output, fmt='jsonl', workers=None, log=sys.stderr):
+    """Parse `paths` across a process pool. jsonl: one compact JSON object per
+    line in the file `output`, in completion order, each with its 'file'.
+    npz: one save_columns archive per input in the directory `output`.
+    Returns the number of files that failed."""
+    destinations = {}
+    if fmt == 'npz':
+        os.makedirs(output, exist_ok=True)
+        taken = set()
+        for path in paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            name, n = stem, 1
+            while name in taken:  # same file name from different directories
+                n += 1
+                name = f'{stem}-{n}'
+            taken.add(name)
+            destinations[path] = os.path.join(output, name + '.npz')
+
+    failed = notes_total = events_total = 0
+    t0 = time.perf_counter()
+    sink = open(output, 'w', encoding='utf-8') if fmt == 'jsonl' else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_batch_parse, path, fmt, destinations.get(path)): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    line, notes, events, seconds = future.result()
+                except Exception as ex:
+                    failed += 1
+                    print(f'FAILED  {path}: {type(ex).__name__}: {ex}', file=log)
+                    continue
+                if sink is not None:
+                    sink.write(line + '\n')
+                notes_total += notes
+                events_total += events
+                print(f'{seconds * 1000:9.1f} ms  {notes:>8} notes  {path}', file=log)
+    finally:
+        if sink is not None:
+            sink.close()
+    wall = time.perf_counter() - t0
+    done = len(paths) - failed
+    print(f'{done} files ({failed} failed), {notes_total:,} notes, {events_total:,} events in {wall:.2f}s: '
+          f'{done / wall if wall else 0:.1f} files/s, {events_total / wall if wall else 0:,.0f} events/s -> {output}',
+          file=log)
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Parse a MIDI file into JSON.')
-    parser.add_argument('midi_file', help='Path to the MIDI file')
-    parser.add_argument('-o', '--output', help='Path for output JSON file')
+    parser.add_argument('midi_file', nargs='*',
+                        help='Path to the MIDI file (with --batch: files, directories or glob patterns)')
+    parser.add_argument('-o', '--output',
+                        help='Path for output JSON file (with --batch: the .jsonl file, or the npz directory)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Report parse throughput on the given file (or every file in imports/) '
+                             'and on a synthetic file with 100k tempo events')
+    parser.add_argument('--pairing', choices=['fifo', 'lifo'], default='fifo',
+                        help='Which open note a note-off ends when a key was struck again before it')
+    parser.add_argument('--batch', action='store_true', help='Parse many files in parallel worker processes')
+    parser.add_argument('--format', choices=['jsonl', 'npz'], default='jsonl',
+                        help='Batch output: compact JSON Lines, or per-file columnar .npz archives')
+    parser.add_argument('--workers', type=int, help='Batch worker processes (default: CPU count)')
     args = parser.parse_args()
 
-    data = parse_midi(args.midi_file)
+    if args.batch:
+        if not args.midi_file or not args.output:
+            parser.error('--batch needs input paths and -o/--output')
+        paths = expand_inputs(args.midi_file)
+        if not paths:
+            parser.error('no MIDI files found')
+        sys.exit(1 if batch(paths, args.output, args.format, args.workers) else 0)
+    if len(args.midi_file) > 1:
+        parser.error('several files need --batch')
+    midi_file = args.midi_file[0] if args.midi_file else None
+
+    if args.benchmark:
+        paths = [midi_file] if midi_file else sorted(glob.glob(os.path.join(IMPORTS_DIR, '*.mid')))
+        benchmark(paths)
+        return
+    if not midi_file:
+        parser.error('midi_file is required')
+
+    data = parse_midi(midi_file, args.pairing)
     if args.output:
         with open(args.output, 'w') as f:
             json.dump(data, f, indent=2)
@@ -160,4 +498,4 @@ def main():
         print(json.dumps(data, indent=2))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,167 @@
+"""
+notetable.py: Columnar note and playback tables backed by NumPy structured arrays.
+One row per note / per scheduled event instead of one Python dict each, so
+filtering, sorting and lookups run vectorized.
+"""
+import numpy as np
+
+NOTE_DTYPE = np.dtype([
+    ('start', 'f8'),
+    ('end', 'f8'),
+    ('note', 'u1'),
+    ('velocity', 'u1'),
+    ('channel', 'u1'),
+    ('track', 'u2'),
+])
+
+# Schedule event types, stored as small ints in the 'type' column
+EV_OFF, EV_ON, EV_PEDAL, EV_PROGRAM = 0, 1, 2, 3
+EVENT_NAMES = {EV_OFF: 'off', EV_ON: 'on', EV_PEDAL: 'pedal', EV_PROGRAM: 'program'}
+
+# 'value' is the velocity for note events, the controller value for pedals
+# and the program number for program changes
+SCHEDULE_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('type', 'u1'),
+    ('note', 'u1'),
+    ('value', 'u1'),
+    ('channel', 'u1'),
+    ('track', 'u2'),
+])
+
+
+def empty_notes():
+    return np.empty(0, dtype=NOTE_DTYPE)
+
+
+def empty_schedule():
+    return np.empty(0, dtype=SCHEDULE_DTYPE)
+
+
+def notes_from_rows(rows):
+    """rows: iterable of (start, end, note, velocity, channel, track)."""
+    return np.array(rows, dtype=NOTE_DTYPE) if len(rows) else empty_notes()
+
+
+def schedule_from_rows(rows):
+    """rows: iterable of (time, type, note, value, channel, track); returned sorted by time (stable)."""
+    table = np.array(rows, dtype=SCHEDULE_DTYPE) if len(rows) else empty_schedule()
+    return table[np.argsort(table['time'], kind='stable')]
+
+
+def notes_to_dicts(notes):
+    return [
+        {'note': n, 'start': s, 'end': e, 'velocity': v, 'channel': c, 'track': t}
+        for s, e, n, v, c, t in notes.tolist()
+    ]
+
+
+def schedule_to_dicts(schedule):
+    out = []
+    for time_sec, typ, note, value, channel, track in schedule.tolist():
+        if typ == EV_PEDAL:
+            out.append({'time': time_sec, 'type': 'pedal', 'value': value, 'channel': channel, 'track': track})
+        elif typ == EV_PROGRAM:
+            out.append({'time': time_sec, 'type': 'program', 'program': value, 'channel': channel, 'track': track})
+        else:
+            out.append({'time': time_sec, 'type': EVENT_NAMES[typ], 'note': note, 'velocity': value,
+                        'channel': channel, 'track': track})
+    return out
+
+
+def filter_notes(notes, min_velocity=20, min_duration=0.02):
+    mask = (notes['velocity'] >= min_velocity) & ((notes['end'] - notes['start']) >= min_duration)
+    return notes[mask]
+
+
+class NoteFilter:
+    """filter_notes() for repeated threshold changes on the same notes: the
+    velocity and duration columns are precomputed as contiguous arrays, so a
+    new cut is two vectorized comparisons and one gather."""
+
+    def __init__(self, notes):
+        self.notes = notes
+        self.velocity = np.ascontiguousarray(notes['velocity'])
+        self.durations = notes['end'] - notes['start']
+
+    def __call__(self, min_velocity=20, min_duration=0.02):
+        keep = np.flatnonzero((self.velocity >= min_velocity) & (self.durations >= min_duration))
+        # take() gathers structured rows far faster than fancy indexing
+        return self.notes.take(keep)
+
+
+def note_events(schedule):
+    """Mask of the note on/off rows of a schedule."""
+    return (schedule['type'] == EV_ON) | (schedule['type'] == EV_OFF)
+
+
+def schedule_duration(schedule):
+    times = schedule['time'][note_events(schedule)]
+    return float(times.max()) if len(times) else 0.0
+
+
+class SeekIndex:
+    """Keyboard and pedal state snapshots every `interval` schedule events.
+    state_at(idx) starts from the nearest snapshot at or before idx and
+    replays at most `interval` events, so seeking costs O(interval) instead
+    of replaying the schedule from the start."""
+
+    def __init__(self, schedule, interval=256):
+        self.schedule = schedule
+        self.interval = interval
+        n = len(schedule)
+        checkpoints = np.arange(0, n + 1, interval)  # snapshot c = state before event c * interval
+        self.held = np.zeros((len(checkpoints), 128), dtype=bool)
+        self.pedal = np.zeros(len(checkpoints), dtype=np.uint8)
+        types, notes = schedule['type'], schedule['note']
+        # For every key, the last event before each checkpoint decides whether it is held
+        key_events = np.flatnonzero(note_events(schedule))
+        by_key = key_events[np.argsort(notes[key_events], kind='stable')]
+        bounds = np.searchsorted(notes[by_key], np.arange(129))
+        for key in range(128):
+            idx = by_key[bounds[key]:bounds[key + 1]]
+            if not len(idx):
+                continue
+            last = np.searchsorted(idx, checkpoints, side='left') - 1
+            seen = last >= 0
+            self.held[seen, key] = types[idx[last[seen]]] == EV_ON
+        pedal_events = np.flatnonzero(types == EV_PEDAL)
+        last = np.searchsorted(pedal_events, checkpoints, side='left') - 1
+        seen = last >= 0
+        self.pedal[seen] = schedule['value'][pedal_events[last[seen]]]
+
+    def state_at(self, idx):
+        """(set of held notes, sustain pedal value) after the first idx events."""
+        c = idx // self.interval
+        held = set(np.flatnonzero(self.held[c]).tolist())
+        pedal = int(self.pedal[c])
+        events = self.schedule[c * self.interval:idx]
+        for typ, note, value in zip(events['type'].tolist(), events['note'].tolist(), events['value'].tolist()):
+            if typ == EV_ON:
+                held.add(note)
+            elif typ == EV_OFF:
+                held.discard(note)
+            elif typ == EV_PEDAL:
+                pedal = value
+        return held, pedal
+
+
+class NoteIndex:
+    """Notes sorted by start time plus the longest note length, so every note
+    overlapping [t0, t1] starts within [t0 - max_length, t1] and can be found
+    with two binary searches."""
+
+    def __init__(self, notes):
+        self.notes = notes.take(np.argsort(notes['start'], kind='stable'))
+        # Contiguous copy: searchsorted on a strided field view copies it on every call
+        self.starts = np.ascontiguousarray(self.notes['start'])
+        self.max_length = float((self.notes['end'] - self.starts).max()) if len(notes) else 0.0
+
+    def __len__(self):
+        return len(self.notes)
+
+    def visible(self, t0, t1):
+        lo = np.searchsorted(self.starts, t0 - self.max_length, side='left')
+        hi = np.searchsorted(self.starts, t1, side='right')
+        candidates = self.notes[lo:hi]
+        return candidates[candidates['end'] >= t0]
@@ -0,0 +1,118 @@
+"""
+parsecache.py: Persistent cache of parsed note and schedule tables.
+Entries are keyed by the MIDI file's content hash and midiparser.PARSER_VERSION,
+and stored as plain .npy files that are memory-mapped back on a hit, so
+reloading a previously seen file skips mido and parse_midi entirely.
+"""
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+from notetable import NOTE_DTYPE, SCHEDULE_DTYPE
+
+TABLES = {'notes': NOTE_DTYPE, 'playback_schedule': SCHEDULE_DTYPE}
+
+
+class ParseCache:
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(path):
+        from midiparser import PARSER_VERSION
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return f'{h.hexdigest()}-v{PARSER_VERSION}'
+
+    def _file(self, key, table):
+        return os.path.join(self.directory, f'{key}.{table}.npy')
+
+    def load(self, key):
+        """Cached tables for `key` (read-only memory maps), or None."""
+        files = {table: self._file(key, table) for table in TABLES}
+        try:
+            tables = {table: np.load(f, mmap_mode='r') for table, f in files.items()}
+        except (OSError, ValueError):
+            return None
+        if any(tables[t].dtype != dtype for t, dtype in TABLES.items()):
+            return None
+        for f in files.values():
+            os.utime(f)  # mtime doubles as last-used time for pruning
+        return tables
+
+    def store(self, key, tables, prune=True):
+        for table in TABLES:
+            final = self._file(key, table)
+            tmp = f'{final}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(tables[table]))
+            os.replace(tmp, final)  # readers never see a half-written entry
+        if prune:
+            self.prune()
+
+    def lookup(self, path):
+        """(key, tables or None) for `path`, counting the hit or miss."""
+        key = self.key(path)
+        tables = self.load(key)
+        if tables is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, tables
+
+    def save(self, key, tables, prune=True):
+        """Store, ignoring disk errors. Bulk writers pass prune=False and
+        call prune() once at the end."""
+        try:
+            self.store(key, {table: tables[table] for table in TABLES}, prune)
+        except OSError:
+            pass  # a read-only or full disk only costs us the cache
+
+    def parse(self, path):
+        """Like parse_midi_tables(path), limited to the 'notes' and
+        'playback_schedule' tables, served from the cache when possible."""
+        key, tables = self.lookup(path)
+        if tables is None:
+            from midiparser import parse_midi_tables
+            tables = parse_midi_tables(path)
+            self.save(key, tables)
+        return {table: tables[table] for table in TABLES}
+
+    def prune(self):
+        """Drop entries from other parser versions, then the least recently
+        used ones until the cache fits in max_bytes."""
+        from midiparser import PARSER_VERSION
+        suffix = f'-v{PARSER_VERSION}'
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.npy'):
+                continue
+            key = name.split('.', 1)[0]
+            if not key.endswith(suffix):
+                self._remove(path)
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:  # e.g. still mapped on Windows
+            return False
@@ -0,0 +1,84 @@
+"""
+profiling.py: Opt-in frame-pacing and paint-time recorder for the live view.
+One row per playback tick (MainWindow.update_playback); the paints that
+tick triggers add their durations to it. Rows can be summarized for the
+on-canvas overlay or saved as CSV/JSON.
+"""
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+FIELDS = ('clock', 'song_time', 'tick_interval_ms', 'timer_late_ms', 'events',
+          'roll_paint_ms', 'visible_notes', 'keyboard_paint_ms', 'keyboard_paints')
+
+
+class FrameProfiler:
+    def __init__(self, timer_interval, capacity=100000, clock=time.perf_counter):
+        """timer_interval: nominal tick period in seconds."""
+        self.timer_interval = timer_interval
+        self.clock = clock
+        self.rows = deque(maxlen=capacity)
+        self.last_tick = None
+
+    def timer_started(self):
+        """The first tick after a (re)start has no previous tick to be late against."""
+        self.last_tick = None
+
+    def tick(self, song_time, events):
+        """Start a new row: one update_playback tick that dispatched `events` schedule events."""
+        now = self.clock()
+        interval = (now - self.last_tick) * 1000 if self.last_tick is not None else float('nan')
+        self.last_tick = now
+        self.rows.append({
+            'clock': now, 'song_time': song_time,
+            'tick_interval_ms': interval, 'timer_late_ms': interval - self.timer_interval * 1000,
+            'events': events,
+            'roll_paint_ms': 0.0, 'visible_notes': 0, 'keyboard_paint_ms': 0.0, 'keyboard_paints': 0,
+        })
+
+    def paint_roll(self, seconds, visible_notes):
+        if self.rows:
+            row = self.rows[-1]
+            row['roll_paint_ms'] += seconds * 1000
+            row['visible_notes'] = visible_notes
+
+    def paint_keyboard(self, seconds):
+        if self.rows:
+            row = self.rows[-1]
+            row['keyboard_paint_ms'] += seconds * 1000
+            row['keyboard_paints'] += 1
+
+    def summary(self, last=100):
+        """Overlay text lines over the most recent `last` ticks."""
+        rows = list(self.rows)[-last:]
+        if not rows:
+            return ['profiling: waiting for playback']
+        col = {f: np.array([r[f] for r in rows], dtype=float) for f in FIELDS}
+        late = col['timer_late_ms'][~np.isnan(col['timer_late_ms'])]
+        late_p95 = np.percentile(late, 95) if len(late) else 0.0
+        late_max = late.max() if len(late) else 0.0
+        tick_ms = np.nanmean(col['tick_interval_ms']) if len(late) else float('nan')
+        return [
+            f'tick {tick_ms:5.1f} ms  late p95 {late_p95:5.1f}  max {late_max:5.1f} ms',
+            f'roll paint p50 {np.median(col["roll_paint_ms"]):5.2f}  max {col["roll_paint_ms"].max():5.2f} ms  '
+            f'{int(col["visible_notes"][-1])} notes',
+            f'keys paint p50 {np.median(col["keyboard_paint_ms"]):5.2f}  max {col["keyboard_paint_ms"].max():5.2f} ms',
+            f'events/tick mean {col["events"].mean():4.1f}  max {int(col["events"].max())}',
+        ]
+
+    def dump(self, path):
+        """Write every recorded row; JSON when `path` ends in .json, CSV otherwise."""
+        rows = list(self.rows)
+        if path.lower().endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'timer_interval_ms': self.timer_interval * 1000, 'fields': FIELDS,
+                           'rows': [[None if v != v else v for v in (r[k] for k in FIELDS)] for r in rows]}, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        return len(rows)
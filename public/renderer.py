@@ -0,0 +1,402 @@
+"""
+renderer.py: QPainter drawing code shared by the live widgets (main.py) and
+the offline exporter (export.py): key geometry, note brushes, the falling
+notes, the pedal label and the keyboard.
+Only needs QtGui, so it also runs under a headless QGuiApplication.
+"""
+from functools import lru_cache
+
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtGui import (
+    QColor, QPainter, QBrush, QPen, QLinearGradient, QGradient, QPixmap, QRegion, QImage,
+)
+
+from density import LOWEST_KEY
+from notetable import EV_PEDAL, NoteIndex
+
+BLACK_SEMITONES = {1, 3, 6, 8, 10}
+BACKGROUND = QColor('#2e2e2e')
+DEFAULT_LEFT_COLOR = '#0077cc'
+DEFAULT_RIGHT_COLOR = '#00bb44'
+
+
+class KeyboardLayout:
+    """Horizontal geometry of the 88 keys (MIDI 21-108) for a given widget width."""
+
+    def __init__(self, width):
+        self.width = width
+        self.white_width = width / 52.0
+        self.black_width = self.white_width * 0.6
+        self.white_keys = []   # MIDI numbers, left to right
+        self.black_keys = []
+        self.x = {}            # MIDI number -> left edge
+        self.key_width = {}    # MIDI number -> key width
+        self.is_black = {}
+        for midi in range(21, 109):
+            if midi % 12 not in BLACK_SEMITONES:
+                self.x[midi] = len(self.white_keys) * self.white_width
+                self.key_width[midi] = self.white_width
+                self.is_black[midi] = False
+                self.white_keys.append(midi)
+        for midi in self.white_keys:
+            black_midi = midi + 1
+            if black_midi % 12 in BLACK_SEMITONES:
+                self.x[black_midi] = self.x[midi] + self.white_width - self.black_width / 2
+                self.key_width[black_midi] = self.black_width
+                self.is_black[black_midi] = True
+                self.black_keys.append(black_midi)
+
+
+@lru_cache(maxsize=8)
+def keyboard_layout(width):
+    """Canvas and keyboard share the same width, hence the same layout instance."""
+    return KeyboardLayout(width)
+
+
+class NoteBrushes:
+    """Gradient brushes for falling notes, one per (base color, black/white key)."""
+
+    def __init__(self, left_color=DEFAULT_LEFT_COLOR, right_color=DEFAULT_RIGHT_COLOR):
+        self.pen = QPen(QColor(0, 0, 0, 150), 1)
+        self.cache = {}
+        self.set_colors(left_color, right_color)
+
+    def set_colors(self, left, right):
+        self.left_color = QColor(left)
+        self.right_color = QColor(right)
+        self.cache.clear()
+        self.colors = None
+
+    def key_colors(self):
+        """(88, 3) float32 BGR note colors of MIDI 21-108, for density images."""
+        if self.colors is None:
+            colors = []
+            for num in range(LOWEST_KEY, LOWEST_KEY + 88):
+                base = self.left_color if num < 60 else self.right_color
+                if num % 12 in BLACK_SEMITONES:
+                    base = base.darker(130)
+                colors.append((base.blue(), base.green(), base.red()))
+            self.colors = np.array(colors, dtype=np.float32)
+        return self.colors
+
+    def brush(self, num, black):
+        base = self.left_color if num < 60 else self.right_color
+        key = (base.rgba(), black)
+        brush = self.cache.get(key)
+        if brush is None:
+            if black:
+                base = base.darker(130)
+            # Gradient in object coordinates spans whatever rect it fills,
+            # so one brush serves every note of this color class
+            grad = QLinearGradient(0, 0, 1, 0)
+            grad.setCoordinateMode(QGradient.ObjectMode)
+            grad.setColorAt(0, base.darker(120))
+            grad.setColorAt(1, base.lighter(120))
+            brush = self.cache[key] = QBrush(grad)
+        return brush
+
+
+def paint_notes(painter, visible, keys, brushes, current_time, time_window, height):
+    """Draw the falling notes of `visible` (NOTE_DTYPE rows) over a roll of `height` pixels."""
+    x_map, widths, is_black = keys.x, keys.key_width, keys.is_black
+    pps = height / time_window if time_window > 0 else 0
+    painter.setPen(brushes.pen)
+    for start, end, num in zip(visible['start'].tolist(), visible['end'].tolist(), visible['note'].tolist()):
+        length = end - start
+        rel = start - current_time
+        if num in x_map:
+            y = (time_window - rel) * pps - length * pps
+            rect = QRectF(x_map[num], y, widths[num], length * pps)
+            painter.setBrush(brushes.brush(num, is_black[num]))
+            painter.drawRoundedRect(rect, 4, 4)
+
+
+def density_image(values, colors):
+    """Premultiplied ARGB QImage with one pixel per `values` cell (see
+    density.DensityPyramid), in `colors` (BGR, broadcast against values) and
+    as opaque as the cell is busy."""
+    alpha = np.sqrt(np.clip(values, 0.0, 1.0))[..., None]
+    pixels = np.empty(values.shape + (4,), dtype=np.uint8)
+    pixels[..., :3] = colors * alpha
+    pixels[..., 3:] = alpha * 255
+    height, width = values.shape
+    return QImage(pixels.data, width, height, width * 4, QImage.Format_ARGB32_Premultiplied).copy()
+
+
+def paint_density(painter, pyramid, keys, brushes, current_time, time_window, height):
+    """Zoomed-out replacement for paint_notes: one image row per pyramid bin
+    of the window, stretched over each key's column, so the cost follows the
+    roll height instead of the note count."""
+    values, first, step = pyramid.span(current_time, current_time + time_window, height)
+    if not len(values):
+        return
+    image = density_image(values[::-1], brushes.key_colors())  # latest bin on top
+    pps = height / time_window
+    top = (time_window - (first + len(values) * step - current_time)) * pps
+    span = len(values) * step * pps
+    for num in keys.white_keys + keys.black_keys:  # black keys over the white ones
+        painter.drawImage(QRectF(keys.x[num], top, keys.key_width[num], span), image,
+                          QRectF(num - LOWEST_KEY, 0, 1, len(values)))
+
+
+class NoteSprites:
+    """Batched alternative to paint_notes with the same look. Every note is
+    drawn from an atlas of pre-rendered pieces of its key's rounded rect: a
+    top cap, a bottom cap (one per 1/`buckets` pixel of sub-pixel offset,
+    since aliased edges depend on it) and a one-row middle slice stretched
+    to the note's length. All pieces go out in one drawPixmapFragments call,
+    with no pen or brush changes. Notes too short to split are drawn with
+    drawRoundedRect in between, keeping the paint order.
+    The atlas is rebuilt whenever the width or the colors change; keys keep
+    their roll x positions in it, so the vertical edges match exactly."""
+
+    CAP = 6  # rows per cap, enough for the 4 px corner radius plus outline
+
+    def __init__(self, brushes, buckets=8):
+        self.brushes = brushes
+        self.buckets = buckets
+        self.atlas = None
+        self.atlas_key = None
+        self.columns = {}  # MIDI number -> (x, width, first atlas row) of its pieces
+
+    def _build(self, keys):
+        cap, buckets = self.CAP, self.buckets
+        rows = 2 * buckets * cap + 1  # top caps, bottom caps, middle slice
+        width = int(np.ceil(keys.width)) + 1
+        # Outlines of neighbouring white keys share a pixel column, so
+        # alternate white keys and the black keys get separate row groups
+        groups = {m: i % 2 for i, m in enumerate(keys.white_keys)}
+        groups.update((m, 2) for m in keys.black_keys)
+        self.atlas = QPixmap(width, 3 * rows)
+        self.atlas.fill(Qt.transparent)
+        self.columns = {}
+        painter = QPainter(self.atlas)
+        painter.setPen(self.brushes.pen)
+        for m, group in groups.items():
+            x, w = keys.x[m], keys.key_width[m]
+            x0 = max(int(np.floor(x)) - 1, 0)
+            pw = min(int(np.ceil(x + w)) + 1, width) - x0
+            top = group * rows
+            self.columns[m] = (x0, pw, top)
+            painter.setBrush(self.brushes.brush(m, keys.is_black[m]))
+            for b in range(buckets):
+                frac = (b + 0.5) / buckets
+                painter.setClipRect(x0, top + b * cap, pw, cap)
+                painter.drawRoundedRect(QRectF(x, top + b * cap + frac, w, 100), 4, 4)
+                bottom = top + (buckets + b + 1) * cap - 1 + frac
+                painter.setClipRect(x0, top + (buckets + b) * cap, pw, cap)
+                painter.drawRoundedRect(QRectF(x, bottom - 100, w, 100), 4, 4)
+            painter.setClipRect(x0, top + rows - 1, pw, 1)
+            painter.drawRoundedRect(QRectF(x, top + rows - 51, w, 100), 4, 4)
+        painter.end()
+
+    def paint(self, painter, visible, keys, current_time, time_window, height):
+        """Same arguments as paint_notes (minus the brushes, set at construction)."""
+        if painter.device().devicePixelRatioF() != 1 or painter.testRenderHint(QPainter.Antialiasing):
+            # The atlas holds aliased device pixels
+            paint_notes(painter, visible, keys, self.brushes, current_time, time_window, height)
+            return
+        key = (keys.width, self.brushes.left_color.rgba(), self.brushes.right_color.rgba())
+        if self.atlas_key != key:
+            self._build(keys)
+            self.atlas_key = key
+        pps = height / time_window if time_window > 0 else 0
+        top = (time_window - (visible['end'] - current_time)) * pps
+        bottom = (time_window - (visible['start'] - current_time)) * pps
+        first, last = np.floor(top), np.floor(bottom)
+        top_bucket = np.minimum((top - first) * self.buckets, self.buckets - 1).astype(np.intp)
+        bottom_bucket = np.minimum((bottom - last) * self.buckets, self.buckets - 1).astype(np.intp) + self.buckets
+
+        cap, mid = self.CAP, 2 * self.buckets * self.CAP
+        columns, create, atlas = self.columns, QPainter.PixmapFragment.create, self.atlas
+        fragments = []
+        painter.setPen(self.brushes.pen)
+        for num, y, yb, r0, r1, bt, bb in zip(
+                visible['note'].tolist(), top.tolist(), bottom.tolist(), first.tolist(), last.tolist(),
+                top_bucket.tolist(), bottom_bucket.tolist()):
+            column = columns.get(num)
+            if column is None:
+                continue
+            if r1 - r0 < 2 * cap:
+                if fragments:
+                    painter.drawPixmapFragments(fragments, atlas)
+                    fragments = []
+                painter.setBrush(self.brushes.brush(num, keys.is_black[num]))
+                painter.drawRoundedRect(QRectF(keys.x[num], y, keys.key_width[num], yb - y), 4, 4)
+                continue
+            x0, pw, row = column
+            cx = x0 + pw / 2
+            middle = r1 - r0 + 1 - 2 * cap
+            fragments.append(create(QPointF(cx, r0 + cap / 2), QRectF(x0, row + bt * cap, pw, cap)))
+            fragments.append(create(QPointF(cx, r1 + 1 - cap / 2), QRectF(x0, row + bb * cap, pw, cap)))
+            fragments.append(create(QPointF(cx, r0 + cap + middle / 2), QRectF(x0, row + mid, pw, 1), 1, middle))
+        if fragments:
+            painter.drawPixmapFragments(fragments, atlas)
+
+
+def thumbnail_image(cells, color):
+    """QImage of a library.thumbnail array: `color` on BACKGROUND, fainter
+    where fewer notes overlap."""
+    color = QColor(color)
+    height, width = cells.shape
+    weight = cells.astype(np.float32)[..., None] / 255.0
+    bgra = lambda c: np.array([c.blue(), c.green(), c.red(), 255], dtype=np.float32)
+    pixels = (bgra(BACKGROUND) * (1.0 - weight) + bgra(color) * weight).astype(np.uint8)
+    return QImage(pixels.data, width, height, width * 4, QImage.Format_RGB32).copy()
+
+
+def paint_pedal_text(painter, on):
+    color = QColor('red') if on else QColor('gray')
+    font = painter.font()
+    font.setPointSize(20)
+    painter.setFont(font)
+    painter.setPen(QPen(color))
+    painter.drawText(10, 50, "Pedals ON" if on else "Pedals OFF")
+
+
+def paint_overlay_text(painter, lines, top=80):
+    """Monospace diagnostics below the pedal label (see profiling.FrameProfiler)."""
+    font = painter.font()
+    font.setFamily('monospace')
+    font.setStyleHint(font.Monospace)
+    font.setPointSize(9)
+    painter.setFont(font)
+    metrics = painter.fontMetrics()
+    step = metrics.lineSpacing()
+    width = max((metrics.horizontalAdvance(line) for line in lines), default=0)
+    painter.fillRect(6, top - metrics.ascent() - 4, width + 8, step * len(lines) + 6, QColor(0, 0, 0, 170))
+    painter.setPen(QPen(QColor('#e0e0e0')))
+    for i, line in enumerate(lines):
+        painter.drawText(10, top + i * step, line)
+
+
+class KeyboardPainter:
+    """Keyboard geometry and brushes for one widget size. Idle keys are
+    rendered once into a pixmap; paint() blits the requested area from it
+    and only re-draws pressed keys (and the keys overlapping them) on top."""
+
+    def __init__(self, left_color=DEFAULT_LEFT_COLOR, right_color=DEFAULT_RIGHT_COLOR):
+        self.keys = keyboard_layout(0)
+        self.key_rects = {}  # MIDI number -> QRectF
+        self.hit_rects = {}  # key rect grown by the antialiased outline
+        self.neighbors = {}  # MIDI number -> keys whose outline touches it, in paint order
+        self.idle_pixmap = None
+        self.size = None
+        self.white_brush = QBrush(QColor('#ffffff'))
+        self.black_brush = QBrush(QColor('#000'))
+        self.outline_pen = QPen(QColor('#000'))
+        self.pressed_brushes = {}
+        self.set_colors(left_color, right_color)
+
+    def set_colors(self, left, right):
+        self.left_color = QColor(left)
+        self.right_color = QColor(right)
+        self.pressed_brushes.clear()
+
+    def pressed_brush(self, m):
+        col = self.left_color if m < 60 else self.right_color
+        brush = self.pressed_brushes.get(col.rgba())
+        if brush is None:
+            brush = self.pressed_brushes[col.rgba()] = QBrush(col.lighter(150))
+        return brush
+
+    def resize(self, w, h, dpr=1.0, background=BACKGROUND):
+        if self.size == (w, h, dpr):
+            return
+        self.size = (w, h, dpr)
+        self.keys = keyboard_layout(w)
+        black_h = h * 0.6
+        self.key_rects = {m: QRectF(self.keys.x[m], 0, self.keys.key_width[m], h) for m in self.keys.white_keys}
+        self.key_rects.update({m: QRectF(self.keys.x[m], 0, self.keys.key_width[m], black_h) for m in self.keys.black_keys})
+        self.hit_rects = {m: r.adjusted(-1, -1, 1, 1) for m, r in self.key_rects.items()}
+        order = self.keys.white_keys + self.keys.black_keys
+        self.neighbors = {m: [k for k in order if self.hit_rects[k].intersects(self.hit_rects[m])] for m in order}
+
+        self.idle_pixmap = QPixmap(max(int(w * dpr), 1), max(int(h * dpr), 1))
+        self.idle_pixmap.setDevicePixelRatio(dpr)
+        self.idle_pixmap.fill(background)
+        painter = QPainter(self.idle_pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.paint_keys(painter, order, pressed=())
+        painter.end()
+
+    def paint_keys(self, painter, keys, pressed):
+        painter.setPen(self.outline_pen)
+        for m in keys:
+            rect = self.key_rects[m]
+            painter.fillRect(rect, self.black_brush if self.keys.is_black[m] else self.white_brush)
+            painter.drawRect(rect)
+            if m in pressed:
+                painter.fillRect(rect, self.pressed_brush(m))
+
+    def dirty_region(self, notes):
+        region = QRegion()
+        for m in notes:
+            if m in self.hit_rects:
+                region += self.hit_rects[m].toAlignedRect()
+        return region
+
+    def paint(self, painter, rect, pressed, region=None):
+        """Composite the keyboard inside `rect` (a QRect in keyboard coordinates)."""
+        dpr = self.idle_pixmap.devicePixelRatioF()
+        source = QRectF(rect.x() * dpr, rect.y() * dpr, rect.width() * dpr, rect.height() * dpr)
+        painter.drawPixmap(QRectF(rect), self.idle_pixmap, source)
+
+        target = QRectF(rect)
+        pressed = [m for m in pressed if m in self.hit_rects and self.hit_rects[m].intersects(target)]
+        if pressed:
+            # Re-draw in the original order only where pressed keys are
+            redraw = set()
+            for m in pressed:
+                redraw.update(self.neighbors[m])
+            clip = self.dirty_region(pressed) & (region if region is not None else QRegion(rect))
+            painter.save()
+            painter.setClipRegion(clip, Qt.IntersectClip)
+            painter.setRenderHint(QPainter.Antialiasing)
+            order = [m for m in self.keys.white_keys + self.keys.black_keys if m in redraw]
+            self.paint_keys(painter, order, set(pressed))
+            painter.restore()
+
+
+class FrameRenderer:
+    """Offline counterpart of PianoRollCanvas + PianoKeyboardWidget: draws the
+    roll and keyboard for any time t into a QImage, independent of wall-clock
+    time. The keyboard takes 1/5 of the height, like the main window layout."""
+
+    def __init__(self, notes, schedule, width, height, *, time_window=5.0,
+                 left_color=DEFAULT_LEFT_COLOR, right_color=DEFAULT_RIGHT_COLOR):
+        self.width, self.height = width, height
+        self.roll_height = round(height * 4 / 5)
+        self.time_window = time_window
+        self.index = NoteIndex(notes)
+        pedals = schedule[schedule['type'] == EV_PEDAL]
+        self.pedal_times = np.ascontiguousarray(pedals['time'])
+        self.pedal_values = pedals['value']
+        self.keys = keyboard_layout(width)
+        self.brushes = NoteBrushes(left_color, right_color)
+        self.sprites = NoteSprites(self.brushes)
+        self.keyboard = KeyboardPainter(left_color, right_color)
+        self.keyboard.resize(width, height - self.roll_height)
+        self.keyboard_rect = self.keyboard.idle_pixmap.rect()
+        self.image = QImage(width, height, QImage.Format_RGB32)
+
+    def pedal_on(self, t):
+        i = int(np.searchsorted(self.pedal_times, t, side='right'))
+        return i > 0 and self.pedal_values[i - 1] >= 64
+
+    def render(self, t, image=None):
+        """Draw the frame at time t into `image` (a width x height QImage.Format_RGB32).
+        Without one, the renderer's own image is used and reused by the next call."""
+        image = self.image if image is None else image
+        visible = self.index.visible(t, t + self.time_window)
+        held = visible[(visible['start'] <= t) & (visible['end'] > t)]
+        painter = QPainter(image)
+        painter.fillRect(0, 0, self.width, self.roll_height, BACKGROUND)
+        self.sprites.paint(painter, visible, self.keys, t, self.time_window, self.roll_height)
+        paint_pedal_text(painter, self.pedal_on(t))
+        painter.setClipRect(0, self.roll_height, self.width, self.height - self.roll_height)
+        painter.translate(0, self.roll_height)
+        self.keyboard.paint(painter, self.keyboard_rect, set(held['note'].tolist()))
+        painter.end()
+        return image
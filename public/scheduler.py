@@ -0,0 +1,286 @@
+"""
+scheduler.py: Sends a MidiModel schedule to the MIDI/synth output from its
+own thread. Song times are mapped to time.perf_counter() deadlines; the
+thread sleeps until shortly before each deadline and spins the rest, so
+sends are neither quantized by the GUI timer nor skewed by wall-clock
+adjustments. The GUI only reads position() to draw.
+With a timestamping output (pygame.midi.Output opened with a latency) the
+thread instead hands over the next `write_ahead` seconds of events as one
+timestamped output.write() batch, and PortMidi delivers them on time.
+"""
+import sys
+import threading
+import time
+
+import numpy as np
+
+from notetable import EV_OFF, EV_ON, EV_PEDAL, EV_PROGRAM, empty_schedule
+
+MAX_WRITE = 1024  # events per pygame.midi.Output.write call
+SWITCH_INTERVAL = 0.001
+
+
+def lower_switch_interval(interval=SWITCH_INTERVAL):
+    """Any thread running Python code (painting, say) can hold the GIL for up
+    to the interpreter's switch interval, 5 ms by default, delaying the
+    scheduler thread as much. This lowers it to `interval` for the whole
+    process; the app calls it once at startup."""
+    sys.setswitchinterval(min(sys.getswitchinterval(), interval))
+
+
+def schedule_messages(schedule):
+    """(n, 3) uint8 MIDI messages (status, data1, data2) for the schedule rows."""
+    types, channels = schedule['type'], schedule['channel']
+    messages = np.zeros((len(schedule), 3), dtype=np.uint8)
+    status = np.select([types == EV_ON, types == EV_OFF, types == EV_PEDAL, types == EV_PROGRAM],
+                       [0x90, 0x80, 0xB0, 0xC0])
+    messages[:, 0] = status | channels
+    messages[:, 1] = np.where(types == EV_PEDAL, 64, np.where(types == EV_PROGRAM, schedule['value'], schedule['note']))
+    messages[:, 2] = np.where((types == EV_ON) | (types == EV_PEDAL), schedule['value'], 0)
+    return messages
+
+
+class PlaybackScheduler:
+    """output: anything with write_short (pygame.midi.Output,
+    audio.SynthOutput), or None to only keep time. Events go out on their
+    schedule 'channel' (see MidiModel.routed_schedule).
+    Once a deadline is reached, events due within the next `lookahead`
+    seconds go out with it; the last `spin` seconds before a deadline are
+    busy-waited instead of slept.
+    write_ahead > 0 switches to timestamped batches: `output` must have
+    write() and have been opened with `latency` ms > 0, and midi_clock()
+    must return its clock in ms (pygame.midi.time).
+    Pause, seek, loop and reroute end every note (and sustain) already
+    sent; play resends the programs and pedals in effect at the position.
+    See lower_switch_interval for keeping other threads from delaying it.
+    Set `log` to a list to record (scheduled, actual) clock pairs per event;
+    in batch mode, actual is the delivery time the timestamp asks for."""
+
+    def __init__(self, output=None, *, lookahead=0.0005, spin=0.002, clock=time.perf_counter,
+                 write_ahead=0.0, latency=0.0, midi_clock=None):
+        self.output = output
+        self.lookahead = lookahead
+        self.spin = spin
+        self.clock = clock
+        self.write_ahead = write_ahead if output is not None else 0.0
+        self.latency = latency
+        self.midi_clock = midi_clock
+        self.loop = False
+        self.log = None
+        self.playing = False
+        self.finished = False  # reached the end without looping
+        self.speed = 1.0
+        self.duration = 0.0
+        self._set_schedule(empty_schedule())
+        self.idx = 0               # next event to send
+        self.anchor_clock = 0.0    # clock() value at song time anchor_song
+        self.anchor_song = 0.0
+        self.generation = 0        # bumped by every command, invalidates a pending deadline
+        self.sounding = set()      # (channel, note) sent on and not off yet
+        self.sustained = set()     # channels whose last pedal value sent was >= 64
+        self.last_stamp = 0        # batch mode: latest timestamp written, kept monotonic
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='playback-scheduler', daemon=True)
+        self.thread.start()
+
+    def set_output(self, output, *, write_ahead=0.0, latency=0.0, midi_clock=None):
+        """Switch to another output (see __init__), e.g. once the device is open."""
+        with self.cond:
+            self._flush()
+            self.output = output
+            self.write_ahead = write_ahead if output is not None else 0.0
+            self.latency = latency
+            self.midi_clock = midi_clock
+            self.last_stamp = 0
+            if self.playing:
+                self._restore_controllers()
+            self._changed()
+
+    def load(self, schedule, duration):
+        with self.cond:
+            self._flush()
+            self._set_schedule(schedule)
+            self.duration = duration
+            self._move(0.0)
+            self.playing = False
+
+    def reroute(self, schedule):
+        """Swap in the same song with other output channels or programs,
+        keeping the position. Notes sounding on the old routing are cut."""
+        with self.cond:
+            t = self.position()
+            self._flush()
+            self._set_schedule(schedule)
+            self._move(t)
+            if self.playing:
+                self._restore_controllers()
+
+    def position(self):
+        """Current song time in seconds."""
+        with self.cond:
+            if not self.playing:
+                return self.anchor_song
+            return min(self.anchor_song + (self.clock() - self.anchor_clock) * self.speed, self.duration)
+
+    def play(self):
+        with self.cond:
+            self._restore_controllers()
+            self.anchor_clock = self.clock()
+            self.playing = True
+            self.finished = False
+            self._changed()
+
+    def pause(self):
+        with self.cond:
+            sent = self.idx
+            self._move(self.position())
+            # Batch mode: events written ahead are on their way and won't be sent twice
+            self.idx = max(self.idx, sent)
+            self.playing = False
+            self._flush()
+
+    def seek(self, t):
+        """Jump to song time t; events at exactly t count as already sent."""
+        with self.cond:
+            self._flush()
+            self._move(t)
+            if self.playing:
+                self._restore_controllers()
+
+    def set_speed(self, speed):
+        with self.cond:
+            self.anchor_song = self.position()
+            self.anchor_clock = self.clock()
+            self.speed = speed
+            self._changed()
+
+    def close(self):
+        with self.cond:
+            self._flush()
+            self.closed = True
+            self._changed()
+        self.thread.join()
+
+    def _set_schedule(self, schedule):
+        self.schedule = schedule
+        self.times = np.ascontiguousarray(schedule['time'])
+        self.messages = schedule_messages(schedule)
+        types = schedule['type']
+        self.controllers = [np.flatnonzero(types == EV_PROGRAM), np.flatnonzero(types == EV_PEDAL)]
+
+    def _move(self, t):
+        self.anchor_song = t
+        self.anchor_clock = self.clock()
+        # Nothing has been sent at the very start, including events at 0.0
+        self.idx = int(np.searchsorted(self.times, t, side='right' if t > 0 else 'left'))
+        self._changed()
+
+    def _restore_controllers(self):
+        """Re-send each channel's latest program and pedal value before idx, which a seek skips."""
+        restore = []
+        for rows in self.controllers:
+            prior = rows[:np.searchsorted(rows, self.idx)][::-1]
+            _, last = np.unique(self.schedule['channel'][prior], return_index=True)
+            restore.extend(prior[last].tolist())
+        if restore:
+            self._emit(self.messages[sorted(restore)].tolist())
+
+    def _flush(self):
+        """Note-off for every note sent on, and pedal up where it is down."""
+        messages = [[0x80 | channel, note, 0] for channel, note in sorted(self.sounding)]
+        messages += [[0xB0 | channel, 64, 0] for channel in sorted(self.sustained)]
+        if messages:
+            self._emit(messages)
+
+    def _emit(self, messages, deadlines=None):
+        """Send [status, data1, data2] messages: now, or in batch mode at their
+        clock() `deadlines` (now when None). Tracks held notes and pedals."""
+        for status, data1, data2 in messages:
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind == 0x90 and data2:
+                self.sounding.add((channel, data1))
+            elif kind == 0x80 or kind == 0x90:
+                self.sounding.discard((channel, data1))
+            elif kind == 0xB0 and data1 == 64:
+                if data2 >= 64:
+                    self.sustained.add(channel)
+                else:
+                    self.sustained.discard(channel)
+        if self.output is None:
+            return
+        log = self.log if deadlines is not None else None
+        if not self.write_ahead:
+            write_short = self.output.write_short
+            for i, (status, data1, data2) in enumerate(messages):
+                write_short(status, data1, data2)
+                if log is not None:
+                    log.append((deadlines[i], self.clock()))
+            return
+
+        offset = self.midi_clock() - self.clock() * 1000.0  # midi clock ms - our clock ms
+        if deadlines is None:
+            stamps = np.full(len(messages), offset + self.clock() * 1000.0 - self.latency)
+        else:
+            stamps = np.asarray(deadlines) * 1000.0 + offset - self.latency
+        # PortMidi sends past timestamps at once; keep them from overtaking earlier writes
+        stamps = np.maximum.accumulate(np.maximum(np.rint(stamps).astype(np.int64), self.last_stamp)).tolist()
+        self.last_stamp = stamps[-1]
+        if log is not None:
+            log.extend(zip(deadlines, ((s + self.latency - offset) / 1000.0 for s in stamps)))
+        packets = [[message, stamp] for message, stamp in zip(messages, stamps)]
+        for start in range(0, len(packets), MAX_WRITE):
+            self.output.write(packets[start:start + MAX_WRITE])
+
+    def _changed(self):
+        self.generation += 1
+        self.cond.notify()
+
+    def _deadline(self, t):
+        return self.anchor_clock + (t - self.anchor_song) / self.speed
+
+    def _run(self):
+        cond = self.cond
+        while True:
+            with cond:
+                while self.playing is False and not self.closed:
+                    cond.wait()
+                if self.closed:
+                    return
+                generation = self.generation
+                # Events past `duration` (trailing pedal changes) are never sent
+                if self.idx < len(self.times) and self.times[self.idx] <= self.duration:
+                    # Batch mode writes the next write_ahead seconds once half of them are used up
+                    deadline = self._deadline(self.times[self.idx]) - self.write_ahead / 2
+                else:
+                    deadline = self._deadline(self.duration)
+                wait = deadline - self.clock()
+                if wait > self.spin:
+                    cond.wait(wait - self.spin)  # woken early by any command
+                    continue
+            while self.clock() < deadline:
+                time.sleep(0)
+            with cond:
+                if generation == self.generation:
+                    self._send_due()
+
+    def _send_due(self):
+        now = self.clock()
+        horizon = self.anchor_song + (now + max(self.lookahead, self.write_ahead) - self.anchor_clock) * self.speed
+        end = int(np.searchsorted(self.times, min(horizon, self.duration), side='right'))
+        if end > self.idx:
+            deadlines = ((self.times[self.idx:end] - self.anchor_song) / self.speed + self.anchor_clock).tolist()
+            self._emit(self.messages[self.idx:end].tolist(), deadlines)
+            self.idx = end
+        if self._deadline(self.duration) > now + self.lookahead:
+            return
+        self._flush()
+        if self.loop:
+            self.anchor_clock = self._deadline(self.duration)
+            self.anchor_song = 0.0
+            self.idx = 0
+        else:
+            self.anchor_song = self.duration
+            self.playing = False
+            self.finished = True
+        self.generation += 1
@@ -0,0 +1,65 @@
+"""
+startup.py: Launch timing for `main.py --startup-profile`. main.py imports
+this module first; with the flag on its command line, every module main.py
+imports is timed (cumulative, like python -X importtime) along with the
+launch phases, and report() lists them against the time-to-first-paint
+budget.
+"""
+import builtins
+import sys
+import time
+
+ENABLED = '--startup-profile' in sys.argv
+
+
+class StartupProfiler:
+    """Phase marks and import costs, in seconds since the profiler was created."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.t0 = clock()
+        self.marks = {}     # phase -> time reached
+        self.imports = []   # (module, started at, seconds)
+
+    def mark(self, phase):
+        """Record the first time `phase` is reached."""
+        self.marks.setdefault(phase, self.clock() - self.t0)
+
+    def watch_imports(self, importers=('__main__', 'main')):
+        """Time each first import of a module made from the `importers` modules,
+        including the ones deferred to functions and threads."""
+        original = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules or (globals or {}).get('__name__') not in importers:
+                return original(name, globals, locals, fromlist, level)
+            start = self.clock()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self.imports.append((name, start - self.t0, self.clock() - start))
+
+        builtins.__import__ = timed_import
+
+    def report(self, first_paint='first paint', budget=None):
+        """Text report; imports started after `first_paint` are listed as deferred."""
+        painted = self.marks.get(first_paint)
+        lines = ['Launch phases (ms since main.py started):']
+        for phase, at in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f'  {at * 1000:8.1f}  {phase}')
+        for title, deferred in (('Imports before the first paint', False), ('Deferred imports', True)):
+            rows = [(seconds, name, start) for name, start, seconds in self.imports
+                    if (painted is not None and start >= painted) == deferred]
+            if rows:
+                lines.append(f'{title} ({sum(r[0] for r in rows) * 1000:.1f} ms):')
+                for seconds, name, start in sorted(rows, reverse=True):
+                    lines.append(f'  {seconds * 1000:8.1f}  {name}  (at {start * 1000:.0f})')
+        if budget is not None and painted is not None:
+            verdict = 'within' if painted * 1000 <= budget else 'OVER'
+            lines.append(f'Time to first paint {painted * 1000:.1f} ms: {verdict} the {budget:g} ms budget')
+        return '\n'.join(lines)
+
+
+profiler = StartupProfiler()
+if ENABLED:
+    profiler.watch_imports()
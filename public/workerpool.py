@@ -0,0 +1,13 @@
+"""
+workerpool.py: Process pools for the exporter and the song library. Workers
+are spawned rather than forked: a forked child would inherit the parent's Qt
+state. Spawned workers re-import the main module, so scripts creating a pool
+need an `if __name__ == '__main__'` guard.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def spawn_pool(workers, **kwargs):
+    """ProcessPoolExecutor with `workers` spawned processes; kwargs as for it."""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), **kwargs)